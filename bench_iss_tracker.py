@@ -0,0 +1,445 @@
+#! /usr/bin/env python3
+#import relevant python libraries
+import argparse
+import datetime
+import http.server
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+#size of the chunks the fixture is read in, matching what the app asks response.iter_content() for
+CHUNK_SIZE = 64*1024
+
+#the published file covers 15 days with a state vector every 4 minutes
+FIXTURE_DAYS = 15
+FIXTURE_STEP = 240
+
+def read_chunks(path):
+    """
+    A generator that reads a file in CHUNK_SIZE pieces, standing in for
+    response.iter_content().
+    """
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def write_fixture(path, start = None, days = FIXTURE_DAYS, step = FIXTURE_STEP):
+    """
+    A function that writes a full-size OEM file in the same layout as the
+    published one, with the ISS on a circular 51.6 degree orbit. It is used
+    when no recorded copy of the ISS data is given. The data starts three
+    days before `start` so that /now falls inside it, like the live file.
+
+    Args:
+        path (string): Where to write the file.
+        start (datetime): The current time (defaults to now, in UTC).
+        days (int): Number of days the data covers.
+        step (int): Seconds between state vectors.
+    """
+    if start is None:
+        start = datetime.datetime.now(datetime.timezone.utc)
+    start = start.replace(second = 0, microsecond = 0) - datetime.timedelta(days = 3)
+    mu = 398600.4418
+    radius = 6795.0
+    speed = math.sqrt(mu/radius)
+    inclination = math.radians(51.6)
+    epoch = lambda t: t.strftime('%Y-%jT%H:%M:%S.000Z')
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<ndm><oem id="CCSDS_OEM_VERS" version="2.0">\n')
+        f.write(f'<header><CREATION_DATE>{epoch(start)}</CREATION_DATE><ORIGINATOR>JSC</ORIGINATOR></header>\n')
+        f.write('<body><segment><metadata><OBJECT_NAME>ISS</OBJECT_NAME><OBJECT_ID>1998-067-A</OBJECT_ID><CENTER_NAME>EARTH</CENTER_NAME><REF_FRAME>EME2000</REF_FRAME><TIME_SYSTEM>UTC</TIME_SYSTEM>')
+        f.write(f'<START_TIME>{epoch(start)}</START_TIME><STOP_TIME>{epoch(start + datetime.timedelta(days = days))}</STOP_TIME></metadata>\n')
+        f.write('<data><COMMENT>Units are in kg and m^2</COMMENT><COMMENT>MASS=459325.00</COMMENT><COMMENT/>\n')
+        for i in range(days*86400//step + 1):
+            angle = speed/radius*i*step
+            x, y = radius*math.cos(angle), radius*math.sin(angle)
+            vx, vy = -speed*math.sin(angle), speed*math.cos(angle)
+            values = (x, y*math.cos(inclination), y*math.sin(inclination), vx, vy*math.cos(inclination), vy*math.sin(inclination))
+            f.write(f'<stateVector><EPOCH>{epoch(start + datetime.timedelta(seconds = i*step))}</EPOCH>')
+            for name, units, value in zip(('X', 'Y', 'Z', 'X_DOT', 'Y_DOT', 'Z_DOT'), ('km',)*3 + ('km/s',)*3, values):
+                f.write(f'<{name} units="{units}">{value:.9f}</{name}>')
+            f.write('</stateVector>\n')
+        f.write('</data></segment></body></oem></ndm>\n')
+
+def measure(function, repeat) -> dict:
+    """
+    A function that calls `function` `repeat` times and summarises how long
+    each call took.
+
+    Returns:
+        result (dictionary): min, median, mean and max seconds per call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times), 'max': max(times), 'repeat': repeat}
+
+def parse_worker(parser, path) -> dict:
+    """
+    A function that parses the fixture once with the named parser and
+    reports the time taken and how much the process's peak RSS grew. It is
+    meant to run in a fresh process (see bench_parse) so the peak RSS of
+    one parser does not hide the other's.
+
+    Args:
+        parser (string): 'xmltodict' for the whole-file xmltodict path,
+                         'stream' for the streaming expat parser.
+        path (string): Location of the OEM fixture file.
+
+    Returns:
+        result (dictionary): parse time in seconds, peak RSS growth in KiB
+                             and number of state vectors parsed.
+    """
+    import iss_tracker
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if parser == 'xmltodict':
+        #the previous behaviour: the whole body in memory, then the full dict tree
+        with open(path, 'rb') as f:
+            dataset = iss_tracker.parse_oem(f.read())
+    else:
+        dataset = iss_tracker.parse_oem_stream(read_chunks(path))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'seconds': elapsed, 'peak_rss_kib': peak - baseline, 'state_vectors': len(dataset.vectors)}
+
+def bench_parse(path) -> dict:
+    """
+    A function that compares the xmltodict and streaming parsers on the
+    fixture, each in its own process.
+
+    Args:
+        path (string): Location of the OEM fixture file.
+
+    Returns:
+        result (dictionary): parse_worker results keyed by parser name.
+    """
+    results = {}
+    for parser in ('xmltodict', 'stream'):
+        output = subprocess.run([sys.executable, __file__, '--parse-worker', parser, path], capture_output=True, text=True, check=True)
+        results[parser] = json.loads(output.stdout)
+    return results
+
+def bench_math(path, repeat) -> dict:
+    """
+    A function that times avg_speed over every state vector, for both the
+    columnar store and a plain list of row dicts.
+
+    Args:
+        path (string): Location of the OEM fixture file.
+        repeat (int): Number of timed calls.
+
+    Returns:
+        result (dictionary): measure() results keyed by case.
+    """
+    import iss_tracker
+    vectors = iss_tracker.parse_oem_stream(read_chunks(path)).vectors
+    rows = list(vectors)
+    return {'state_vectors': len(vectors),
+            'avg_speed_store': measure(lambda: iss_tracker.avg_speed(vectors), repeat),
+            'avg_speed_rows': measure(lambda: iss_tracker.avg_speed(rows), repeat),
+            'speed_single': measure(lambda: iss_tracker.speed(rows[-1]), repeat)}
+
+def bench_location(path, repeat, sample = 100) -> dict:
+    """
+    A function that times find_location on one state vector, one at a time
+    over a sample of state vectors, and the vectorized ground track over
+    every state vector.
+
+    Args:
+        path (string): Location of the OEM fixture file.
+        repeat (int): Number of timed calls.
+        sample (int): Number of state vectors in the one-at-a-time case.
+
+    Returns:
+        result (dictionary): measure() results keyed by case.
+    """
+    import iss_tracker
+    vectors = iss_tracker.parse_oem_stream(read_chunks(path)).vectors
+    rows = [vectors[i] for i in range(min(sample, len(vectors)))]
+    #the first transform loads astropy's Earth orientation tables, so it is left out of the timings
+    iss_tracker.find_location(rows[0])
+    return {'state_vectors': len(vectors),
+            'find_location_single': measure(lambda: iss_tracker.find_location(rows[0]), repeat),
+            'find_location_loop': dict(measure(lambda: [iss_tracker.find_location(row) for row in rows], max(1, repeat//5)), state_vectors = len(rows)),
+            'ground_track_bulk': measure(lambda: iss_tracker.GroundTrack(vectors), max(1, repeat//5))}
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the fixture in place of the NASA server, with an ETag so the
+    app's conditional requests get 304 answers like they would upstream.
+    """
+    body = b''
+    etag = '"fixture"'
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_fixture(path):
+    """
+    A function that starts the stand-in upstream server on a free local port.
+
+    Returns:
+        server (ThreadingHTTPServer): The running server.
+        url (string): The URL the fixture is served at.
+    """
+    with open(path, 'rb') as f:
+        FixtureHandler.body = f.read()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/ISS.OEM_J2K_EPH.xml'
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction*len(values)))]
+
+def bench_routes(path, concurrency, requests_per_level) -> dict:
+    """
+    A function that points the app at the stand-in server and requests every
+    route through Flask's test client from several threads at once.
+
+    Args:
+        path (string): Location of the OEM fixture file.
+        concurrency (list): Numbers of threads to run at the same time.
+        requests_per_level (int): Requests made per route at each level.
+
+    Returns:
+        result (dictionary): the time of the first (cold) request, and for
+                             each route and concurrency level the
+                             throughput, latency percentiles and number of
+                             non-200 answers.
+    """
+    import iss_tracker
+    server, url = serve_fixture(path)
+    original = iss_tracker.feed_cache, iss_tracker.refresher
+    iss_tracker.feed_cache = iss_tracker.FeedCache(url)
+    iss_tracker.refresher = iss_tracker.Refresher(iss_tracker.feed_cache)
+    try:
+        client = iss_tracker.app.test_client()
+        start = time.perf_counter()
+        client.get('/header')
+        results = {'cold_start': time.perf_counter() - start, 'routes': {}}
+
+        vectors = iss_tracker.refresher.get()[0].vectors
+        epoch = vectors.epoch(len(vectors)//2)
+        end = vectors.epoch(len(vectors)//2 + 30)
+        routes = ['/', '/epochs', '/epochs?limit=20&offset=5', f'/epochs/{epoch}', f'/epochs/{epoch}?match=nearest',
+                  f'/epochs/{epoch}/speed', f'/epochs/{epoch}/location', '/comment', '/header', '/metadata',
+                  '/now', f'/at?t={epoch}', f'/groundtrack?start={epoch}&end={end}', f'/epochs/{epoch}/illumination', '/eclipses',
+                  '/passes?observer=29.56,-95.09&observer=51.51,-0.13&observer=-33.87,151.21', '/metrics']
+        for route in routes:
+            #one untimed request so per-route setup (like the geocoder's gazetteer) is not counted
+            client.get(route)
+            results['routes'][route] = {}
+            for threads in concurrency:
+                results['routes'][route][str(threads)] = bench_route(iss_tracker.app, route, threads, requests_per_level)
+        return results
+    finally:
+        iss_tracker.refresher.stop()
+        iss_tracker.feed_cache, iss_tracker.refresher = original
+        server.shutdown()
+
+def bench_route(app, route, threads, total) -> dict:
+    """
+    A function that makes `total` requests to `route` spread over `threads`
+    threads, each with its own test client.
+    """
+    latencies = []
+    failures = []
+    barrier = threading.Barrier(threads)
+    def worker(count):
+        client = app.test_client()
+        barrier.wait()
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get(route)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+    counts = [total//threads + (1 if i < total % threads else 0) for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(count,)) for count in counts]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {'requests': total, 'seconds': elapsed, 'requests_per_second': total/elapsed,
+            'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95), 'max': max(latencies), 'failures': len(failures)}
+
+def startup_worker(mode) -> dict:
+    """
+    A function that imports the app and makes its first request (to /now,
+    which needs the ISS data, astropy and the geocoder), optionally warming
+    up in between. It is meant to run in a fresh process (see
+    bench_startup), pointed at the stand-in server by ISS_OEM_URL.
+
+    Args:
+        mode (string): 'cold' to make the request straight after importing,
+                       'warm' to call warm_up() first.
+
+    Returns:
+        result (dictionary): import, warm-up and first request times in
+                             seconds.
+    """
+    start = time.perf_counter()
+    import iss_tracker
+    result = {'import': time.perf_counter() - start}
+    if mode == 'warm':
+        start = time.perf_counter()
+        iss_tracker.warm_up()
+        result['warm_up'] = time.perf_counter() - start
+    client = iss_tracker.app.test_client()
+    start = time.perf_counter()
+    response = client.get('/now')
+    result['first_request'] = time.perf_counter() - start
+    result['status'] = response.status_code
+    return result
+
+def bench_startup(path, repeat) -> dict:
+    """
+    A function that measures import time and time to first request, with
+    and without warming up, each run in a fresh process.
+
+    Args:
+        path (string): Location of the OEM fixture file.
+        repeat (int): Number of fresh processes per mode.
+
+    Returns:
+        result (dictionary): the median of each startup_worker timing, keyed
+                             by mode.
+    """
+    server, url = serve_fixture(path)
+    try:
+        results = {}
+        for mode in ('cold', 'warm'):
+            runs = []
+            for _ in range(repeat):
+                output = subprocess.run([sys.executable, __file__, '--startup-worker', mode], capture_output=True, text=True, check=True,
+                                        env=dict(os.environ, ISS_OEM_URL=url))
+                runs.append(json.loads(output.stdout.splitlines()[-1]))
+            results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key != 'status'}
+            results[mode]['failures'] = sum(run['status'] != 200 for run in runs)
+        return results
+    finally:
+        server.shutdown()
+
+def bench_formats(path, repeat) -> dict:
+    """
+    A function that requests every epoch and the whole ground track in each
+    output format, and reports the payload size and how long the route took
+    to build it (with the response cache emptied before every call, so the
+    serialization is timed rather than the cache).
+
+    Args:
+        path (string): Location of the OEM fixture file.
+        repeat (int): Number of timed calls per format.
+
+    Returns:
+        result (dictionary): for each route and format, the payload bytes
+                             and measure() results.
+    """
+    import iss_tracker
+    server, url = serve_fixture(path)
+    original = iss_tracker.feed_cache, iss_tracker.refresher
+    iss_tracker.feed_cache = iss_tracker.FeedCache(url)
+    iss_tracker.refresher = iss_tracker.Refresher(iss_tracker.feed_cache)
+    formats = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'flat_json': iss_tracker.FLAT_JSON,
+               'msgpack': iss_tracker.MSGPACK, 'columns': iss_tracker.COLUMNS}
+    try:
+        client = iss_tracker.app.test_client()
+        client.get('/header')
+        results = {'msgpack_installed': iss_tracker.load_msgpack() is not None}
+        for route in ('/epochs', '/groundtrack'):
+            results[route] = {}
+            for name, media_type in formats.items():
+                if name == 'ndjson' and route != '/epochs' or name == 'msgpack' and not results['msgpack_installed']:
+                    continue
+                def fetch():
+                    iss_tracker.response_cache.clear()
+                    return client.get(route, headers={'Accept': media_type}).get_data()
+                results[route][name] = dict(measure(fetch, repeat), bytes = len(fetch()))
+        return results
+    finally:
+        iss_tracker.refresher.stop()
+        iss_tracker.feed_cache, iss_tracker.refresher = original
+        server.shutdown()
+
+SUITES = ('parse', 'math', 'location', 'routes', 'formats', 'startup')
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmarks for the ISS tracker app.')
+    arg_parser.add_argument('fixture', nargs='?', help='a recorded ISS.OEM_J2K_EPH.xml file (a synthetic 15 day file is generated if left out)')
+    arg_parser.add_argument('--output', help='write the results as JSON to this file')
+    arg_parser.add_argument('--suite', action='append', choices=SUITES, help='only run this suite (can be repeated)')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='timed calls per function benchmark (default 20)')
+    arg_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='threads making route requests at the same time (default 1 4 16)')
+    arg_parser.add_argument('--requests', type=int, default=64, help='requests per route at each concurrency level (default 64)')
+    arg_parser.add_argument('--startup-runs', type=int, default=3, help='fresh processes per startup measurement (default 3)')
+    arg_parser.add_argument('--parse-worker', help=argparse.SUPPRESS)
+    arg_parser.add_argument('--startup-worker', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.parse_worker:
+        print(json.dumps(parse_worker(args.parse_worker, args.fixture)))
+        return
+    if args.startup_worker:
+        print(json.dumps(startup_worker(args.startup_worker)))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        fixture = args.fixture
+        if fixture is None:
+            fixture = os.path.join(folder, 'ISS.OEM_J2K_EPH.xml')
+            write_fixture(fixture)
+        results = {'fixture': {'path': args.fixture or 'synthetic', 'bytes': os.path.getsize(fixture)},
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'date': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+        suites = args.suite or SUITES
+        if 'parse' in suites:
+            results['parse'] = bench_parse(fixture)
+        if 'math' in suites:
+            results['math'] = bench_math(fixture, args.repeat)
+        if 'location' in suites:
+            results['location'] = bench_location(fixture, args.repeat)
+        if 'routes' in suites:
+            results['routes'] = bench_routes(fixture, args.concurrency, args.requests)
+        if 'formats' in suites:
+            results['formats'] = bench_formats(fixture, args.repeat)
+        if 'startup' in suites:
+            results['startup'] = bench_startup(fixture, args.startup_runs)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,1455 @@
 #! /usr/bin/env python3
 #import relevant python libraries
-from flask import Flask, request
-from astropy import coordinates
-from astropy import units
-from astropy.time import Time
-from geopy.geocoders import Nominatim
-import xmltodict
+#(astropy, geopy and xmltodict are slow to import and only needed by some routes, so they are imported where they are used)
+from flask import Flask, request, Response, g, has_request_context
 import requests
 import math
 import time
 import logging
 import socket
+import os
+import re
+import calendar
+import datetime
+import functools
+import threading
+import concurrent.futures
+import csv
+import json
+import base64
+import bisect
+import collections
+import contextlib
+import fcntl
+import hashlib
+from xml.parsers import expat
+import numpy as np
 
 #initating the app for flask/rest API navigation
 app = Flask(__name__)
 
+#location of the ISS OEM data and how long (in seconds) a downloaded copy is trusted before checking upstream again
+OEM_URL = os.environ.get('ISS_OEM_URL', 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
+FEED_TTL = float(os.environ.get('ISS_FEED_TTL', '300'))
+FEED_TIMEOUT = float(os.environ.get('ISS_FEED_TIMEOUT', '30'))
+
+#whether astropy may download newer Earth orientation (IERS) and leap second tables, or only uses the ones installed with it (astropy-iers-data) or the local IERS-A file given here
+IERS_AUTO_DOWNLOAD = os.environ.get('ISS_IERS_AUTO_DOWNLOAD', '0').lower() in ('1', 'true', 'yes', 'on')
+IERS_TABLE = os.environ.get('ISS_IERS_TABLE')
+
+#whether the app loads astropy, the gazetteer and the ISS data before it starts answering requests
+WARM_UP = os.environ.get('ISS_WARM_UP', '0').lower() in ('1', 'true', 'yes', 'on')
+
+#the state vector components in the order they are stored in the columnar arrays
+COMPONENTS = ('X', 'Y', 'Z', 'X_DOT', 'Y_DOT', 'Z_DOT')
+EPOCH_PATTERN = re.compile(r'^(\d{4})-(\d{3})T(\d{2}):(\d{2}):(\d{2}(?:\.\d*)?)Z$')
+
+#upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """
+    A histogram of durations in the Prometheus format, kept separately for
+    every combination of label values.
+
+    Args:
+        name (string): The metric name.
+        description (string): The metric's HELP text.
+        labels (tuple): The label names.
+        buckets (tuple): Upper bounds of the buckets, in increasing order.
+    """
+    def __init__(self, name, description, labels, buckets = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        #label values -> [count in each bucket, sum of observations, number of observations]
+        self.series = {}
+
+    def observe(self, value, *labels):
+        """
+        Records one observation for the given label values.
+        """
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0]*len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        """
+        Returns the histogram as lines of the Prometheus text format.
+        """
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self.series.items())
+        for labels, (counts, total, count) in series:
+            names = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labels, labels))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{names},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{names},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{names}}} {total}')
+            lines.append(f'{self.name}_count{{{names}}} {count}')
+        return lines
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+#how long whole requests take, and how long each stage (download, parse, transform, interpolate, geocode) takes within them
+REQUEST_SECONDS = Histogram('iss_request_duration_seconds', 'Time taken to answer a request.', ('route',))
+STAGE_SECONDS = Histogram('iss_stage_duration_seconds', 'Time spent in each stage of answering a request (route is "background" for work done by the refresher).', ('route', 'stage'))
+
+def current_route() -> str:
+    """
+    Returns the route pattern (like /epochs/<epoch>) of the request being
+    handled, 'unmatched' if no route matched it, or 'background' outside of
+    a request.
+    """
+    if not has_request_context():
+        return 'background'
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def record_stage(stage, seconds):
+    """
+    A function that records the time taken by one stage, both in the stage
+    histogram and in the breakdown of the current request (used for the
+    Server-Timing header).
+    """
+    STAGE_SECONDS.observe(seconds, current_route(), stage)
+    if has_request_context():
+        g.setdefault('stages', []).append((stage, seconds))
+
+@contextlib.contextmanager
+def span(stage):
+    """
+    Times the enclosed block as the given stage (see record_stage).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def epoch_to_seconds(epoch: str) -> float:
+    """
+    A function that converts an OEM epoch string to seconds since the Unix
+    epoch (1970-01-01T00:00:00Z).
+
+    Args:
+        epoch (string): An epoch in the format 'YYYY-DDDThh:mm:ss.sssZ'.
+
+    Returns:
+        seconds (float): The number of seconds since 1970-01-01 UTC.
+    """
+    match = EPOCH_PATTERN.match(epoch)
+    if match is None:
+        raise ValueError(f'invalid epoch format: {epoch}\n')
+    year, day, hour, minute, sec = match.groups()
+    return calendar.timegm((int(year), 1, 1, 0, 0, 0)) + (int(day)-1)*86400 + int(hour)*3600 + int(minute)*60 + float(sec)
+
+class StateVectorStore:
+    """
+    A columnar store of ISS state vectors. Epochs are kept as float64
+    seconds since the Unix epoch, positions and velocities as N x 3 float64
+    arrays (km and km/s), and the original text of every value is kept so
+    rows can be rebuilt exactly as xmltodict produced them.
+
+    Args:
+        epochs (numpy array): Epoch strings, shape (N,).
+        seconds (numpy array): Epochs as seconds since 1970-01-01 UTC.
+        positions (numpy array): X, Y, Z positions, shape (N, 3).
+        velocities (numpy array): X_DOT, Y_DOT, Z_DOT velocities, shape (N, 3).
+        texts (numpy array): Original text of the six components, shape (N, 6).
+        units (tuple): The units attribute of each of the six components.
+    """
+    def __init__(self, epochs, seconds, positions, velocities, texts, units):
+        self.epochs = epochs
+        self.seconds = seconds
+        self.positions = positions
+        self.velocities = velocities
+        self.texts = texts
+        self.units = units
+
+    @classmethod
+    def from_state_vectors(cls, state_vectors):
+        """
+        Builds a store from the list of stateVector dictionaries that
+        xmltodict produces.
+
+        Args:
+            state_vectors (list): Dictionaries with keys: EPOCH, X, Y, Z,
+                                  X_DOT, Y_DOT, and Z_DOT.
+
+        Returns:
+            store (StateVectorStore): The columnar store.
+        """
+        #xmltodict returns a single dictionary rather than a list when there is only one state vector
+        if isinstance(state_vectors, dict):
+            state_vectors = [state_vectors]
+        texts = [[item[key]['#text'] for key in COMPONENTS] for item in state_vectors]
+        epochs = [item['EPOCH'] for item in state_vectors]
+        units = tuple(state_vectors[0][key].get('@units') for key in COMPONENTS) if state_vectors else (None,)*6
+        return cls.from_blocks([cls.encode_block(epochs, texts)], units)
+
+    @staticmethod
+    def encode_block(epochs, texts):
+        """
+        Converts a block of state vectors into compact arrays.
+
+        Args:
+            epochs (list): Epoch strings.
+            texts (list): For each epoch, the text of the six components in
+                          COMPONENTS order.
+
+        Returns:
+            block (tuple): Epoch strings, epoch seconds, component values and
+                           component text, as numpy arrays.
+        """
+        try:
+            values = np.array(texts, dtype=np.float64).reshape(-1, 6)
+        except ValueError:
+            raise ValueError('non-float value in state vector\n')
+        return (np.array(epochs, dtype=np.bytes_),
+                np.array([epoch_to_seconds(epoch) for epoch in epochs], dtype=np.float64),
+                values, np.array(texts, dtype=np.bytes_).reshape(-1, 6))
+
+    @classmethod
+    def from_blocks(cls, blocks, units):
+        """
+        Builds a store by concatenating blocks made by encode_block.
+
+        Args:
+            blocks (list): Blocks of state vectors, in epoch order.
+            units (tuple): The units attribute of each of the six components.
+
+        Returns:
+            store (StateVectorStore): The columnar store.
+        """
+        if not blocks:
+            blocks = [cls.encode_block([], [])]
+        epochs, seconds, values, texts = (np.concatenate(column) for column in zip(*blocks))
+        return cls(epochs, seconds, values[:, :3].copy(), values[:, 3:].copy(), texts, units)
+
+    def match(self, other):
+        """
+        Finds the rows whose state vector is also in `other`, with the same
+        epoch and exactly the same text for all six components.
+
+        Args:
+            other (StateVectorStore): The store to compare against.
+
+        Returns:
+            rows (numpy array): The matching rows of this store.
+            other_rows (numpy array): The row each of them is in `other`.
+        """
+        if len(self) == 0 or len(other) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        order = np.argsort(other.seconds, kind='stable')
+        candidate = order[np.minimum(np.searchsorted(other.seconds[order], self.seconds), len(other) - 1)]
+        same = (other.epochs[candidate] == self.epochs) & (other.texts[candidate] == self.texts).all(1)
+        rows = np.flatnonzero(same)
+        return rows, candidate[rows]
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def __getitem__(self, i):
+        return self.row(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def epoch(self, i) -> str:
+        """
+        Returns the epoch string of row i.
+        """
+        return self.epochs[i].decode()
+
+    def row(self, i) -> dict:
+        """
+        Returns row i in the same dictionary layout xmltodict produces for a
+        stateVector element, e.g. {'EPOCH': ..., 'X': {'@units': 'km',
+        '#text': '...'}, ...}.
+        """
+        result = {'EPOCH': self.epochs[i].decode()}
+        for key, unit, text in zip(COMPONENTS, self.units, self.texts[i]):
+            result[key] = {'#text': text.decode()} if unit is None else {'@units': unit, '#text': text.decode()}
+        return result
+
+def parse_time(value: str) -> float:
+    """
+    A function that converts a time given either as an OEM epoch
+    ('YYYY-DDDThh:mm:ss.sssZ') or as an ISO-8601 timestamp (for example
+    '2024-02-19T14:45:00Z') to seconds since the Unix epoch. ISO-8601
+    timestamps without a time zone are taken to be UTC.
+
+    Args:
+        value (string): The time to convert.
+
+    Returns:
+        seconds (float): The number of seconds since 1970-01-01 UTC.
+    """
+    try:
+        return epoch_to_seconds(value)
+    except ValueError:
+        pass
+    text = value.strip()
+    if text[-1:] in ('Z', 'z'):
+        text = text[:-1] + '+00:00'
+    try:
+        when = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'invalid time: {value}; expected an epoch like 2024-050T14:45:00.000Z or an ISO-8601 timestamp like 2024-02-19T14:45:00Z\n')
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.timestamp()
+
+def seconds_to_epoch(seconds: float) -> str:
+    """
+    A function that converts seconds since the Unix epoch to an OEM epoch
+    string, rounded to the millisecond.
+
+    Args:
+        seconds (float): The number of seconds since 1970-01-01 UTC.
+
+    Returns:
+        epoch (string): The epoch in the format 'YYYY-DDDThh:mm:ss.sssZ'.
+    """
+    whole, millis = divmod(int(round(seconds*1000)), 1000)
+    when = datetime.datetime.fromtimestamp(whole, tz=datetime.timezone.utc)
+    return f'{when.year:04d}-{when.timetuple().tm_yday:03d}T{when.hour:02d}:{when.minute:02d}:{when.second:02d}.{millis:03d}Z'
+
+def seconds_to_epochs(seconds) -> list:
+    """
+    A function that converts many times at once to OEM epoch strings, like
+    seconds_to_epoch, with the calendar arithmetic done by numpy instead of
+    one datetime per value.
+
+    Args:
+        seconds (array-like): Seconds since 1970-01-01 UTC, NaN or None where
+                              there is no time.
+
+    Returns:
+        epochs (list): The epochs in the format 'YYYY-DDDThh:mm:ss.sssZ', with
+                       None where there is no time.
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    missing = np.isnan(seconds)
+    when = np.round(np.where(missing, 0, seconds)*1000).astype(np.int64).astype('datetime64[ms]')
+    days = when.astype('datetime64[D]')
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+    #'YYYY-MM-DDThh:mm:ss.sss', of which the year and the time of day are kept
+    text = np.datetime_as_string(when, unit='ms')
+    return [None if gap else f'{t[:4]}-{day:03d}{t[10:]}Z' for t, day, gap in zip(text.tolist(), day_of_year.tolist(), missing.tolist())]
+
+class EpochIndex:
+    """
+    An index over the epochs of a StateVectorStore, built once per dataset
+    version: a hash map for exact epoch strings and a sorted array of epoch
+    seconds for O(log n) nearest and range lookups by bisection.
+
+    Args:
+        vectors (StateVectorStore): The state vectors to index.
+    """
+    def __init__(self, vectors):
+        self.rows = {epoch.decode(): i for i, epoch in enumerate(vectors.epochs)}
+        self.order = np.argsort(vectors.seconds, kind='stable')
+        self.seconds = vectors.seconds[self.order]
+
+    def exact(self, seconds):
+        """
+        Returns the row whose epoch is `seconds` (to within a millisecond),
+        or None if there is no such row.
+        """
+        i = int(np.searchsorted(self.seconds, seconds - 5e-4))
+        if i < len(self.seconds) and abs(self.seconds[i] - seconds) < 5e-4:
+            return int(self.order[i])
+        return None
+
+    def nearest(self, seconds):
+        """
+        Returns the row whose epoch is closest to `seconds`, or None if
+        `seconds` is outside the time span of the data.
+        """
+        if len(self.seconds) == 0 or seconds < self.seconds[0] or seconds > self.seconds[-1]:
+            return None
+        i = int(np.searchsorted(self.seconds, seconds))
+        if i > 0 and (i == len(self.seconds) or seconds - self.seconds[i-1] <= self.seconds[i] - seconds):
+            i -= 1
+        return int(self.order[i])
+
+    def window(self, start = None, end = None):
+        """
+        Returns the positions lo, hi in epoch order such that the epochs
+        from lo up to (not including) hi are those with start <= epoch <= end
+        (either bound may be None).
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.seconds, start, side='left'))
+        hi = len(self.seconds) if end is None else int(np.searchsorted(self.seconds, end, side='right'))
+        return lo, max(lo, hi)
+
+    def range(self, start = None, end = None):
+        """
+        Returns the rows with start <= epoch <= end (either bound may be
+        None), in epoch order.
+        """
+        lo, hi = self.window(start, end)
+        return self.order[lo:hi]
+
+    def sample(self, lo, hi, step = None, max_points = None):
+        """
+        Picks a subset of the epochs between positions lo and hi (in epoch
+        order) for plotting, without looking at any of the other epochs.
+
+        Args:
+            lo (int): First position, as returned by window.
+            hi (int): Position after the last one.
+            step (float): Keep the first epoch at or after every `step`
+                          seconds from the first epoch, so gaps and uneven
+                          spacing in the data are respected.
+            max_points (int): Keep at most this many epochs, evenly strided
+                              and always including the first and last.
+
+        Returns:
+            positions (numpy array): The positions kept, in epoch order.
+        """
+        positions = np.arange(lo, hi)
+        if step is not None and len(positions):
+            #the number of whole steps from the first epoch, keeping the first epoch of each
+            bucket = np.floor((self.seconds[lo:hi] - self.seconds[lo] + 5e-4) / step)
+            positions = positions[np.r_[True, bucket[1:] != bucket[:-1]]]
+        if max_points is not None and len(positions) > max_points:
+            positions = positions[np.unique(np.linspace(0, len(positions) - 1, max_points).round().astype(np.intp))]
+        return positions
+
+    def find(self, epoch, match = 'exact'):
+        """
+        Finds the row for an epoch given as an OEM epoch string or an
+        ISO-8601 timestamp.
+
+        Args:
+            epoch (string): The epoch to look for.
+            match (string): 'exact' to only accept a sample at exactly that
+                            time, 'nearest' to take the closest sample.
+
+        Returns:
+            row (int): The matching row, or None if there is none.
+        """
+        if match not in ('exact', 'nearest'):
+            raise ValueError('Invalid match parameter; match must be "exact" or "nearest"\n')
+        if match == 'exact' and epoch in self.rows:
+            return self.rows[epoch]
+        seconds = parse_time(epoch)
+        return self.exact(seconds) if match == 'exact' else self.nearest(seconds)
+
+class OEMDataset:
+    """
+    One parsed version of the ISS OEM file.
+
+    Args:
+        header (dictionary): The OEM header.
+        metadata (dictionary): The segment metadata.
+        comments (list): The COMMENT lines of the data section.
+        vectors (StateVectorStore): The state vectors.
+        version (int): Which download of the OEM file this is (set by the
+                       FeedCache, 0 if the dataset was parsed directly).
+    """
+    def __init__(self, header, metadata, comments, vectors, version = 0):
+        self.header = header
+        self.metadata = metadata
+        self.comments = comments
+        self.vectors = vectors
+        self.version = version
+
+    def prepare(self):
+        """
+        Builds all of the derived data up front, so no request has to.
+        """
+        self.index
+        self.speeds
+        self.ground_track
+        self.interpolator
+        self.illumination
+        self.itrs
+        return self
+
+    def inherit(self, previous) -> int:
+        """
+        Takes over the speeds, ground track and Sun positions `previous`
+        has already computed for every epoch whose state vector is
+        unchanged, and computes them only for the new or revised epochs.
+        Consecutive OEM files overlap by most of their 15 days, so most of
+        the astropy work is skipped (and the geocoder cache, which is keyed
+        by coordinates, is hit for the same epochs).
+
+        Args:
+            previous (OEMDataset): The dataset this one replaces.
+
+        Returns:
+            reused (int): Number of epochs whose derived data was reused.
+        """
+        carried = [name for name in ('speeds', 'ground_track', 'sun') if name in previous.__dict__ and name not in self.__dict__]
+        if not carried:
+            return 0
+        rows, old = self.vectors.match(previous.vectors)
+        changed = np.ones(len(self.vectors), dtype=bool)
+        changed[rows] = False
+        def merge(before, computed):
+            #the reused values where the epoch is unchanged, the freshly computed ones everywhere else
+            result = np.empty((len(self.vectors),) + before.shape[1:])
+            result[rows] = before[old]
+            result[changed] = computed
+            return result
+
+        if 'speeds' in carried:
+            velocities = self.vectors.velocities[changed]
+            self.speeds = merge(previous.speeds, np.sqrt(np.einsum('ij,ij->i', velocities, velocities)))
+        if 'ground_track' in carried:
+            track = previous.ground_track
+            computed = geodetic(self.vectors.positions[changed], self.vectors.seconds[changed]) if changed.any() else (np.zeros(0),)*3
+            self.ground_track = GroundTrack.from_arrays(*(merge(before, after) for before, after in zip((track.lat, track.lon, track.alt), computed)))
+        if 'sun' in carried:
+            self.sun = merge(previous.sun, sun_positions(self.vectors.seconds[changed]))
+        return len(rows)
+
+    @functools.cached_property
+    def speeds(self):
+        """
+        The speed at every epoch, computed on first use.
+        """
+        return speeds(self.vectors)
+
+    @functools.cached_property
+    def index(self):
+        """
+        The EpochIndex of this dataset's state vectors, built on first use.
+        """
+        return EpochIndex(self.vectors)
+
+    @functools.cached_property
+    def ground_track(self):
+        """
+        The GroundTrack of this dataset's state vectors, computed on first use.
+        """
+        return GroundTrack(self.vectors)
+
+    @functools.cached_property
+    def interpolator(self):
+        """
+        The HermiteInterpolator of this dataset's state vectors, built on
+        first use.
+        """
+        return HermiteInterpolator(self.vectors)
+
+    @functools.cached_property
+    def sun(self):
+        """
+        The position of the Sun at every epoch, computed on first use.
+        """
+        return sun_positions(self.vectors.seconds)
+
+    @functools.cached_property
+    def illumination(self):
+        """
+        The Illumination of the ISS over this dataset, computed on first
+        use.
+        """
+        return Illumination(self.vectors, self.interpolator, self.sun)
+
+    @functools.cached_property
+    def itrs(self):
+        """
+        The ItrsInterpolator of this dataset's ground track, built on first
+        use.
+        """
+        return ItrsInterpolator(self.vectors, self.ground_track)
+
+def parse_oem(content) -> OEMDataset:
+    """
+    A function that parses the contents of an OEM file into an OEMDataset
+    by building the full xmltodict tree first (see parse_oem_stream for the
+    bounded-memory parser the app uses).
+
+    Args:
+        content (bytes or generator): The ISS.OEM_J2K_EPH.xml file contents.
+
+    Returns:
+        dataset (OEMDataset): The parsed header, metadata, comments and
+                              state vectors.
+    """
+    import xmltodict
+    data = xmltodict.parse(content)
+    segment = data['ndm']['oem']['body']['segment']
+    return OEMDataset(data['ndm']['oem']['header'], segment['metadata'], segment['data'].get('COMMENT'),
+                      StateVectorStore.from_state_vectors(segment['data']['stateVector']))
+
+#number of state vectors collected before they are packed into numpy arrays by the streaming parser, and the size of the chunks it is fed
+STREAM_BLOCK_SIZE = 1024
+STREAM_CHUNK_SIZE = 64*1024
+
+def parse_oem_stream(chunks) -> OEMDataset:
+    """
+    A function that parses an OEM file incrementally with expat, so the
+    whole file never has to be held in memory. State vectors are packed
+    into compact numpy blocks as they arrive, while the header, metadata and
+    COMMENT lines are captured in the same layout xmltodict gives them.
+
+    Args:
+        chunks (bytes or iterable): The file contents, either all at once or
+                                    as an iterable of chunks (for example
+                                    response.iter_content()).
+
+    Returns:
+        dataset (OEMDataset): The parsed header, metadata, comments and
+                              state vectors.
+    """
+    if isinstance(chunks, (bytes, str)):
+        chunks = [chunks]
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+
+    sections = {}       #the header and metadata, once they have been fully read
+    nodes = []          #xmltodict style nodes of the header/metadata element currently being read
+    names = []          #names of the currently open elements
+    text = []           #character data of the innermost open element
+    comments = []
+    blocks = []
+    epochs, texts = [], []
+    units = [None]*6
+    vector = None
+
+    def start(name, attrs):
+        nonlocal vector
+        parent = names[-1] if names else None
+        names.append(name)
+        text.clear()
+        if nodes or (name == 'header' and parent == 'oem') or (name == 'metadata' and parent == 'segment'):
+            nodes.append({f'@{key}': value for key, value in attrs.items()})
+        elif name == 'stateVector':
+            vector = {}
+        elif vector is not None and name in COMPONENTS:
+            units[COMPONENTS.index(name)] = attrs.get('units')
+
+    def end(name):
+        nonlocal vector
+        names.pop()
+        value = ''.join(text).strip()
+        text.clear()
+        if nodes:
+            node = nodes.pop()
+            if value:
+                node['#text'] = value
+            if len(node) == 1 and '#text' in node:
+                node = value
+            elif not node:
+                node = None
+            if nodes:
+                #repeated child elements become a list, as xmltodict does
+                parent = nodes[-1]
+                if name not in parent:
+                    parent[name] = node
+                elif isinstance(parent[name], list):
+                    parent[name].append(node)
+                else:
+                    parent[name] = [parent[name], node]
+            else:
+                sections[name] = node
+        elif name == 'stateVector':
+            epochs.append(vector['EPOCH'])
+            texts.append([vector[key] for key in COMPONENTS])
+            vector = None
+            if len(epochs) >= STREAM_BLOCK_SIZE:
+                blocks.append(StateVectorStore.encode_block(epochs, texts))
+                epochs.clear()
+                texts.clear()
+        elif vector is not None:
+            vector[name] = value
+        elif name == 'COMMENT' and names and names[-1] == 'data':
+            comments.append(value or None)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text.append
+    for chunk in chunks:
+        parser.Parse(chunk, False)
+    parser.Parse(b'', True)
+    if epochs:
+        blocks.append(StateVectorStore.encode_block(epochs, texts))
+
+    #xmltodict gives a single COMMENT as a string rather than a list
+    if len(comments) <= 1:
+        comments = comments[0] if comments else None
+    return OEMDataset(sections.get('header'), sections.get('metadata'), comments,
+                      StateVectorStore.from_blocks(blocks, tuple(units)))
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function and every caller that arrives while it is running waits on the
+    same future and gets the same result (or exception).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Runs fn() unless a call with the same key is already running, in
+        which case waits for that call instead.
+
+        Args:
+            key (hashable): Identifies calls that can share a result.
+            fn (function): The function to run, with no arguments.
+
+        Returns:
+            result: What fn() returned.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+class ChunkMeter:
+    """
+    Wraps the chunks of a download, counting their bytes and how long was
+    spent waiting for them to arrive.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def __iter__(self):
+        iterator = iter(self.chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.seconds += time.perf_counter() - start
+            self.bytes += len(chunk)
+            yield chunk
+
+class FeedCache:
+    """
+    A process-wide cache of the parsed ISS OEM file. A cached copy is
+    served as-is for `ttl` seconds; after that the upstream file is
+    revalidated with a conditional GET (If-None-Match / If-Modified-Since)
+    over a pooled requests.Session, so an unchanged file is not downloaded
+    or parsed again.
+
+    Args:
+        url (string): Location of the ISS.OEM_J2K_EPH.xml file.
+        ttl (float): Number of seconds a cached copy is served without
+                     contacting upstream.
+        session (requests.Session): Optional session to reuse connections
+                                    with (one is created if omitted).
+        timeout (float): Timeout in seconds for each upstream request.
+        parser (function): Turns the downloaded chunks into an OEMDataset.
+    """
+    def __init__(self, url, ttl = FEED_TTL, session = None, timeout = FEED_TIMEOUT, parser = parse_oem_stream):
+        self.url = url
+        self.parser = parser
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
+        self.lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.clear()
+
+    def seed(self, data, etag, last_modified, fetched_at):
+        """
+        Uses a dataset that was loaded some other way (from a Snapshot) as
+        the cached copy, so the next refresh is a conditional GET for it.
+
+        Args:
+            data (OEMDataset): The dataset.
+            etag (string): The ETag upstream sent with it.
+            last_modified (string): The Last-Modified date upstream sent with it.
+            fetched_at (float): time.monotonic() when it was last confirmed
+                                to match upstream.
+        """
+        with self.lock:
+            self.data = data
+            self.version = data.version
+            self.etag = etag
+            self.last_modified = last_modified
+            self.fetched_at = fetched_at
+
+    def clear(self):
+        """
+        Drops the cached document, validators and counters.
+        """
+        with self.lock:
+            self.data = None
+            self.version = 0
+            self.etag = None
+            self.last_modified = None
+            self.fetched_at = 0.
+            self.hits = 0
+            self.misses = 0
+            self.revalidations = 0
+            self.errors = 0
+            self.bytes_downloaded = 0
+            self.epochs_downloaded = 0
+            self.epochs_reused = 0
+            self.last_reuse = None
+            self.flight.coalesced = 0
+
+    def fresh(self):
+        """
+        Returns the cached dataset if it is younger than the TTL (counting a
+        hit), otherwise None. Must be called with the lock held.
+        """
+        if self.data is not None and time.monotonic() - self.fetched_at < self.ttl:
+            self.hits += 1
+            return self.data
+        return None
+
+    def get(self):
+        """
+        Returns the parsed OEM file, downloading or revalidating it only
+        if the cached copy is missing or older than the TTL. When many
+        threads find the copy stale at once, only one of them contacts
+        upstream and the others wait for its result.
+
+        Returns:
+            data (OEMDataset): The parsed OEM file.
+        """
+        with self.lock:
+            data = self.fresh()
+        if data is not None:
+            return data
+        try:
+            return self.flight.do(self.url, self.refresh)
+        except (requests.RequestException, ValueError, expat.ExpatError) as e:
+            #keep serving the old copy if upstream is down or sent a broken file
+            with self.lock:
+                self.errors += 1
+                if self.data is None:
+                    raise
+                logging.warning(f'could not refresh the OEM file ({e}), serving cached version {self.version}\n')
+                return self.data
+
+    def refresh(self, force = False):
+        """
+        Downloads or revalidates the OEM file. Called through the
+        single-flight group, so only one refresh runs at a time.
+
+        Args:
+            force (bool): Contact upstream even if the cached copy is
+                          younger than the TTL.
+
+        Returns:
+            data (OEMDataset): The parsed OEM file.
+        """
+        with self.lock:
+            #another thread may have refreshed the copy while this one was waiting
+            data = None if force else self.fresh()
+            if data is not None:
+                return data
+            #send the validators from the last download so upstream can answer with 304 Not Modified
+            headers = {}
+            if self.data is not None:
+                if self.etag:
+                    headers['If-None-Match'] = self.etag
+                if self.last_modified:
+                    headers['If-Modified-Since'] = self.last_modified
+
+        #the body is streamed straight into the parser rather than being read into memory first
+        start = time.perf_counter()
+        response = self.session.get(self.url, headers = headers, timeout = self.timeout, stream = True)
+        if response.status_code == 304:
+            response.close()
+            record_stage('download', time.perf_counter() - start)
+            with self.lock:
+                if self.data is not None:
+                    self.revalidations += 1
+                    self.fetched_at = time.monotonic()
+                    logging.debug(f'upstream OEM file unchanged, keeping cached version {self.version}\n')
+                    return self.data
+            #the cache was cleared while revalidating, so fall back to a full download
+            start = time.perf_counter()
+            response = self.session.get(self.url, timeout = self.timeout, stream = True)
+        waiting = time.perf_counter() - start
+        with response:
+            response.raise_for_status()
+            #downloading and parsing are interleaved, so the time spent waiting for chunks is counted separately
+            chunks = ChunkMeter(response.iter_content(chunk_size = STREAM_CHUNK_SIZE))
+            start = time.perf_counter()
+            data = self.parser(chunks)
+            parsing = time.perf_counter() - start - chunks.seconds
+        record_stage('download', waiting + chunks.seconds)
+        record_stage('parse', parsing)
+        #most epochs are the same as in the previous file, so their derived data is carried over instead of recomputed
+        previous = self.data
+        reused = data.inherit(previous) if previous is not None else 0
+
+        with self.lock:
+            self.data = data
+            self.bytes_downloaded += chunks.bytes
+            self.epochs_downloaded += len(data.vectors)
+            self.epochs_reused += reused
+            self.last_reuse = reused / len(data.vectors) if len(data.vectors) else 0.
+            self.version += 1
+            data.version = self.version
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            self.fetched_at = time.monotonic()
+            self.misses += 1
+            logging.info(f'downloaded OEM file from {self.url}, cached as version {self.version}\n')
+            return data
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            result (dictionary): hits, misses, revalidations and failed
+                                 refreshes so far, how many callers waited
+                                 on another thread's refresh, the bytes
+                                 downloaded, the epochs downloaded and how
+                                 many of them reused the previous file's
+                                 derived data (overall and, as a fraction,
+                                 in the last download, None before the
+                                 first), the current dataset version and
+                                 its age in seconds (None if nothing is
+                                 cached).
+        """
+        with self.lock:
+            age = time.monotonic() - self.fetched_at if self.data is not None else None
+            return {'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations, 'errors': self.errors, 'coalesced': self.flight.coalesced, 'bytes': self.bytes_downloaded,
+                    'epochs': self.epochs_downloaded, 'reused': self.epochs_reused, 'last_reuse': self.last_reuse, 'version': self.version, 'age': age}
+
+#the single feed cache that every route reads from
+feed_cache = FeedCache(OEM_URL)
+
+#whether a background thread keeps the data up to date, and how often (in seconds) it checks upstream
+BACKGROUND_REFRESH = os.environ.get('ISS_BACKGROUND_REFRESH', '1').lower() not in ('0', 'false', 'no', 'off')
+REFRESH_INTERVAL = float(os.environ.get('ISS_REFRESH_INTERVAL', str(FEED_TTL)))
+
+#where the binary snapshot of the ISS data shared by worker processes is kept (none if unset), and how often (in seconds) workers check it for a new version
+SNAPSHOT_PATH = os.environ.get('ISS_SNAPSHOT')
+SNAPSHOT_CHECK = float(os.environ.get('ISS_SNAPSHOT_CHECK', '1'))
+
+class Snapshot:
+    """
+    A binary copy of a prepared OEMDataset on disk, which every worker
+    process memory-maps read-only instead of keeping its own copy. The file
+    is an 8 byte magic number, the length of a JSON description (8 bytes,
+    little endian), the description, and then fixed-width arrays, each
+    starting on a 64 byte boundary: the epochs, seconds, positions,
+    velocities and original texts of the state vectors, the ground track,
+    the position of the Sun, the illumination (state and beta angle at every
+    epoch, and the eclipse table, with NaN for missing entry and exit
+    times) and the interpolator's coefficients. The description holds the version
+    stamp, the header, metadata and comments, the upstream validators, when
+    the data was last confirmed to match upstream, and the dtype, shape and
+    offset of each array.
+
+    Only the process holding the snapshot's lock file refreshes the data and
+    writes the snapshot. Writes go to a temporary file that is then renamed
+    over the old one, so readers only ever see complete snapshots.
+
+    Args:
+        path (string): Location of the snapshot file.
+    """
+    MAGIC = b'ISSOEM\x00\x01'
+    ALIGN = 64
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_file = None
+        #identifies the file last read or written, to tell when another process replaces it
+        self.stamp = None
+
+    def acquire(self) -> bool:
+        """
+        Tries to become the one process that refreshes the data.
+
+        Returns:
+            result (bool): True if this process holds the lock.
+        """
+        if self.lock_file is None:
+            lock_file = open(self.path + '.lock', 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.lock_file = lock_file
+        return True
+
+    def release(self):
+        """
+        Gives up the lock, letting another process refresh the data.
+        """
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def write(self, dataset, etag = None, last_modified = None, confirmed = None):
+        """
+        Atomically replaces the snapshot with the given dataset.
+
+        Args:
+            dataset (OEMDataset): The dataset to store.
+            etag (string): The ETag upstream sent with it.
+            last_modified (string): The Last-Modified date upstream sent with it.
+            confirmed (float): time.time() when the data was last confirmed to
+                               match upstream (defaults to now).
+        """
+        vectors = dataset.vectors
+        track = dataset.ground_track
+        arrays = {'epochs': vectors.epochs, 'seconds': vectors.seconds, 'positions': vectors.positions, 'velocities': vectors.velocities,
+                  'texts': vectors.texts, 'lat': track.lat, 'lon': track.lon, 'alt': track.alt}
+        arrays['sun'] = dataset.sun
+        if len(vectors) > 1:
+            illumination = dataset.illumination
+            arrays.update({'state': illumination.state, 'beta': illumination.beta,
+                           'eclipses': np.array(illumination.eclipses, dtype = np.float64).reshape(-1, 4),
+                           'coefficients': dataset.interpolator.coefficients})
+        description = {'version': dataset.version, 'etag': etag, 'last_modified': last_modified,
+                       'confirmed': time.time() if confirmed is None else confirmed,
+                       'header': dataset.header, 'metadata': dataset.metadata, 'comments': dataset.comments,
+                       'units': list(vectors.units), 'arrays': {}}
+        offset = 0
+        for name, array in arrays.items():
+            arrays[name] = array = np.ascontiguousarray(array)
+            description['arrays'][name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+            offset += -(-array.nbytes // self.ALIGN) * self.ALIGN
+        blob = json.dumps(description).encode()
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(self.MAGIC + len(blob).to_bytes(8, 'little') + blob)
+            f.write(bytes(self.data_start(len(blob)) - f.tell()))
+            for array in arrays.values():
+                f.write(array.tobytes())
+                f.write(bytes(-array.nbytes % self.ALIGN))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self.stamp = self.file_stamp(os.stat(self.path))
+
+    def data_start(self, blob_length) -> int:
+        #the arrays start at the first 64 byte boundary after the description
+        return -(-(16 + blob_length) // self.ALIGN) * self.ALIGN
+
+    @staticmethod
+    def file_stamp(stat):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        """
+        Returns whether the snapshot exists and is not the one last read or
+        written by this process.
+        """
+        try:
+            return self.file_stamp(os.stat(self.path)) != self.stamp
+        except FileNotFoundError:
+            return False
+
+    def open(self):
+        """
+        Memory-maps the snapshot. The arrays of the returned dataset are
+        read-only views of the file, and its ground track, Sun positions,
+        illumination and interpolator are already built from the stored
+        arrays.
+
+        Returns:
+            dataset (OEMDataset): The stored dataset.
+            description (dictionary): The snapshot's description.
+        """
+        with open(self.path, 'rb') as f:
+            stamp = self.file_stamp(os.fstat(f.fileno()))
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f'{self.path} is not an ISS data snapshot\n')
+            length = int.from_bytes(f.read(8), 'little')
+            description = json.loads(f.read(length))
+            #the mapping stays valid after the file is closed, or replaced by a newer snapshot
+            buffer = np.memmap(f, dtype = np.uint8, mode = 'r')
+        start = self.data_start(length)
+        arrays = {name: np.ndarray(tuple(item['shape']), np.dtype(item['dtype']), buffer, start + item['offset'])
+                  for name, item in description['arrays'].items()}
+        vectors = StateVectorStore(arrays['epochs'], arrays['seconds'], arrays['positions'], arrays['velocities'], arrays['texts'], tuple(description['units']))
+        dataset = OEMDataset(description['header'], description['metadata'], description['comments'], vectors, description['version'])
+        dataset.ground_track = GroundTrack.from_arrays(arrays['lat'], arrays['lon'], arrays['alt'])
+        #snapshots written before the Sun and illumination were stored compute them again on first use
+        if 'sun' in arrays:
+            dataset.sun = arrays['sun']
+        if 'state' in arrays:
+            dataset.illumination = Illumination.from_arrays(arrays['state'], arrays['beta'], arrays['eclipses'])
+        if 'coefficients' in arrays:
+            dataset.interpolator = HermiteInterpolator.from_coefficients(arrays['seconds'], arrays['coefficients'])
+        self.stamp = stamp
+        return dataset, description
+
+class Refresher:
+    """
+    A background thread that checks upstream every `interval` seconds,
+    builds everything the routes need from a new OEM file (epoch index,
+    speeds, ground track, interpolator and illumination) off the request
+    path, and then publishes it by swapping a single reference. Routes read
+    whichever snapshot is current without taking any locks. If upstream is
+    down the last snapshot keeps being served and simply gets older.
+
+    With a Snapshot file, only the process holding its lock contacts
+    upstream and it writes every refresh to the file. The other processes
+    map the file instead and reopen it when it is replaced. A restarted
+    process starts from whatever the file holds without downloading.
+
+    Args:
+        cache (FeedCache): Where the OEM file is fetched through.
+        interval (float): Number of seconds between checks.
+        snapshot (Snapshot): Optional snapshot file shared with other
+                             processes.
+    """
+    def __init__(self, cache, interval = REFRESH_INTERVAL, snapshot = None):
+        self.cache = cache
+        self.interval = interval
+        self.snapshot = snapshot
+        #the published (dataset, time it was last confirmed upstream) pair, replaced as a whole
+        self.current = None
+        self.failures = 0
+        self.thread = None
+        self.lock = threading.Lock()
+        self.publishing = threading.Lock()
+        self.stopping = threading.Event()
+
+    def load(self):
+        """
+        Publishes the snapshot file if another process (or this one, before
+        a restart) has written a version this process has not read yet.
+        """
+        if not self.snapshot.changed():
+            return
+        try:
+            dataset, description = self.snapshot.open()
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f'could not read the ISS data snapshot {self.snapshot.path} ({e})\n')
+            return
+        current = self.current
+        if current is not None and current[0].version == dataset.version:
+            #same data, only the time it was confirmed has moved on
+            dataset = current[0]
+        else:
+            dataset.prepare()
+        confirmed = time.monotonic() - max(0., time.time() - description['confirmed'])
+        self.current = (dataset, confirmed)
+        self.cache.seed(dataset, description['etag'], description['last_modified'], confirmed)
+
+    def poll(self, max_age = 0):
+        """
+        Checks upstream and publishes the result, unless the current snapshot
+        was confirmed less than `max_age` seconds ago. With a Snapshot file,
+        upstream is only checked if this process holds its lock, otherwise the
+        file is reread.
+
+        Args:
+            max_age (float): How old the current snapshot may be before
+                             upstream is checked again.
+
+        Returns:
+            dataset (OEMDataset): The dataset that is now current, or None if
+                                  another process refreshes the data and has
+                                  not written a snapshot yet.
+        """
+        with self.publishing:
+            if self.snapshot is not None:
+                self.load()
+                if not self.snapshot.acquire():
+                    return None if self.current is None else self.current[0]
+            #another thread may have published a snapshot while this one was waiting
+            current = self.current
+            if current is not None and time.monotonic() - current[1] < max_age:
+                return current[0]
+            dataset = self.cache.flight.do(self.cache.url, functools.partial(self.cache.refresh, force = True))
+            if current is None or current[0] is not dataset:
+                dataset.prepare()
+            self.current = (dataset, time.monotonic())
+            if self.snapshot is not None:
+                self.snapshot.write(dataset, self.cache.etag, self.cache.last_modified)
+            return dataset
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                self.poll(self.interval)
+            except Exception as e:
+                self.failures += 1
+                logging.warning(f'background refresh of the OEM file failed ({e}), still serving the previous data\n')
+                self.stopping.wait(self.interval)
+                continue
+            #sleeps until the current snapshot is due to be checked again (or the snapshot file is due to be looked at)
+            current = self.current
+            wait = self.interval if current is None else self.interval - (time.monotonic() - current[1])
+            self.stopping.wait(wait if self.snapshot is None else min(wait, SNAPSHOT_CHECK))
+
+    def start(self):
+        """
+        Starts the background thread, if it is not already running. Every
+        request calls this, so a running thread is recognised without taking
+        the lock (run never exits on its own, only through stop).
+        """
+        if self.thread is not None and not self.stopping.is_set():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target = self.run, name = 'oem-refresher', daemon = True)
+                self.thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread.
+        """
+        self.stopping.set()
+        with self.lock:
+            if self.thread is not None:
+                self.thread.join()
+                self.thread = None
+
+    def get(self):
+        """
+        Returns the current snapshot and its age.
+
+        Returns:
+            dataset (OEMDataset): The current dataset (fetched right away if
+                                  nothing has been published yet).
+            age (float): Seconds since the dataset was last confirmed to
+                         match upstream.
+        """
+        current = self.current
+        if current is None:
+            #nothing published yet, so fetch now (any snapshot published meanwhile will do)
+            with span('load'):
+                deadline = time.monotonic() + self.cache.timeout
+                while self.poll(math.inf) is None:
+                    #another process is downloading the data, so wait for it to write the snapshot
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f'no ISS data snapshot was written to {self.snapshot.path} in time\n')
+                    time.sleep(0.05)
+            current = self.current
+        return current[0], time.monotonic() - current[1]
+
+#the background refresher, started by the first request that needs data
+refresher = Refresher(feed_cache, snapshot = Snapshot(SNAPSHOT_PATH) if SNAPSHOT_PATH else None)
+
+def get_dataset():
+    """
+    A function that returns the ISS data a route should use: the
+    refresher's current snapshot, or the feed cache's copy if background
+    refreshing is turned off. The dataset's version and age are recorded so
+    they can be sent back as response headers, and the same dataset is
+    returned for the rest of the request.
+
+    Returns:
+        data (OEMDataset): The current ISS data.
+    """
+    if 'dataset' in g:
+        return g.dataset
+    if BACKGROUND_REFRESH:
+        refresher.start()
+        data, age = refresher.get()
+    else:
+        data = feed_cache.get()
+        age = feed_cache.stats()['age']
+    g.dataset = data
+    g.dataset_version = data.version
+    g.dataset_age = age
+    return data
+
+#how many bytes of serialized responses are kept for the routes whose output only changes with the ISS data
+RESPONSE_CACHE_BYTES = int(os.environ.get('ISS_RESPONSE_CACHE_BYTES', str(32*1024*1024)))
+
+class ResponseCache:
+    """
+    An LRU cache of serialized responses, bounded by their total size in
+    bytes. Keys start with the version of the dataset the response was built
+    from, and every entry is dropped once a newer version is seen.
+
+    Args:
+        max_bytes (int): Largest total size of the cached bodies.
+    """
+    def __init__(self, max_bytes = RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Drops every entry and resets the counters.
+        """
+        with self.lock:
+            self.entries = collections.OrderedDict()
+            self.size = 0
+            self.version = None
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns the (body, headers, etag) entry for key, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """
+        Stores a (body, headers, etag) entry, evicting the least recently
+        used entries until the cache fits in max_bytes again.
+        """
+        size = len(entry[0])
+        with self.lock:
+            if self.version is None or key[0] > self.version:
+                #responses built from older data will not be asked for again
+                self.entries.clear()
+                self.size = 0
+                self.version = key[0]
+            elif key[0] < self.version or size > self.max_bytes:
+                return
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self.entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last = False)
+                self.size -= len(evicted[0])
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters, the number of entries and their total size in bytes.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.size}
+
+#the responses of the routes decorated with cached_response
+response_cache = ResponseCache()
+
+def cached_response(view):
+    """
+    A decorator for routes whose output only depends on the ISS data and the
+    request. The serialized response is cached under the route, its
+    arguments, the sorted query arguments, the Accept header and the dataset
+    version. It is sent with a strong ETag made from the dataset version and
+    a hash of the body, and clients that send that ETag back in
+    If-None-Match get 304 Not Modified. Streamed responses and errors are
+    not cached.
+    """
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        data = get_dataset()
+        key = (data.version, request.url_rule.rule, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi = True))), request.headers.get('Accept', ''))
+        entry = response_cache.get(key)
+        if entry is None:
+            response = app.make_response(view(**kwargs))
+            if response.is_streamed or response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = (body, list(response.headers.items()), f'{data.version}-{hashlib.blake2b(body, digest_size = 8).hexdigest()}')
+            response_cache.put(key, entry)
+        body, headers, etag = entry
+        response = Response(body, headers = headers)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    return wrapper
+
+def warm_up(fetch = True) -> dict:
+    """
+    A function that does the slow one-off work before the first request
+    instead of during it: importing astropy and running one coordinate
+    transform (which loads the Earth orientation tables), loading the
+    gazetteer, and downloading and preparing the ISS data. A failed download
+    is only logged, so the app still starts when upstream is down.
+
+    Args:
+        fetch (bool): Whether to download and prepare the ISS data too.
+
+    Returns:
+        timings (dictionary): Seconds spent on each step.
+    """
+    timings = {}
+    start = time.perf_counter()
+    geodetic(np.array([[EARTH_RADIUS + 400., 0., 0.]]), np.array([time.time()]))
+    timings['transform'] = time.perf_counter() - start
+    start = time.perf_counter()
+    get_geocoder()
+    timings['geocoder'] = time.perf_counter() - start
+    if fetch:
+        start = time.perf_counter()
+        try:
+            if BACKGROUND_REFRESH:
+                refresher.start()
+                refresher.get()
+            else:
+                feed_cache.get().prepare()
+        except Exception as e:
+            logging.warning(f'could not load the ISS data while warming up ({e}), it will be loaded by the first request instead\n')
+        timings['data'] = time.perf_counter() - start
+    logging.info(f'warmed up in {sum(timings.values()):.2f} s\n')
+    return timings
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    #adds the request to the latency histogram, and sends the stage breakdown back if the client asked for it with an X-Profile header
+    elapsed = time.perf_counter() - g.request_start
+    REQUEST_SECONDS.observe(elapsed, current_route())
+    if request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes', 'on'):
+        stages = {}
+        for stage, seconds in g.get('stages', []):
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        stages['total'] = elapsed
+        response.headers['Server-Timing'] = ', '.join(f'{stage};dur={seconds*1000:.3f}' for stage, seconds in stages.items())
+    return response
+
+@app.after_request
+def add_dataset_headers(response):
+    #tells clients which version of the ISS data they got and how old it is
+    if 'dataset_version' in g:
+        response.headers['X-Dataset-Version'] = str(g.dataset_version)
+        response.headers['X-Dataset-Age'] = f'{g.dataset_age:.0f}' if g.dataset_age is not None else '0'
+    return response
+
 def time_range(a_dict) -> str:
     """
     A function that states the time range of a simulation period. Outputs a     string with the first epoch of input and final epoch, then expalins how
@@ -59,6 +1494,20 @@ def currEpoch(a_dict) ->str:
     result = f'The time right now is: {currEPOCH}; the current position of the ISS is: {currPos} km; and the current velocity of the ISS is: {currVel} km/s\n'
     return result
 
+def speeds(vectors):
+    """
+    A function that calculates the speed at every epoch of a state vector
+    store in one vectorized operation.
+
+    Args:
+        vectors (StateVectorStore): The ISS state vectors.
+
+    Returns:
+        speeds (numpy array): The speed at each epoch, in the units of the
+                              velocity components (km/s for ISS data).
+    """
+    return np.sqrt(np.einsum('ij,ij->i', vectors.velocities, vectors.velocities))
+
 def speed(a_dict) -> float:
     """
     A function that calculates speed of an object.
@@ -71,48 +1520,568 @@ def speed(a_dict) -> float:
                        corresponding units of the statevector provided with                        the input object (a_dict).
     """
     #making the inital velocity vector
-    Vel = [float(a_dict['X_DOT']['#text']), float(a_dict['Y_DOT']['#text']), float(a_dict['Z_DOT']['#text'])]
     try:
-        #calculates the speed using Cartesian velocity vectors
-        speed = math.sqrt(Vel[0]**2 + Vel[1]**2 + Vel[2]**2)
+        Vel = np.array([a_dict['X_DOT']['#text'], a_dict['Y_DOT']['#text'], a_dict['Z_DOT']['#text']], dtype=np.float64)
     except ValueError:
-        raise ValueError('Null value\n')
         logging.warning(f'encountered a null value for velcity when trying to calculate the speed in speed()\n')
-    return speed
+        raise ValueError('Null value\n')
+    #calculates the speed using Cartesian velocity vectors
+    return float(np.linalg.norm(Vel))
 
 def avg_speed(a_dict) -> float:
     """
     A function that calculates the average speed of objects in dictionary.
 
     Args:
-        a_dict (dictionary): A dictionary list of ISS epoch and state
-                             vectors in 4 minute intervals for 15 day 
-                             period of time.
+        a_dict (StateVectorStore or list): The ISS state vectors, either as
+                             a columnar store or a list of dictionaries, in
+                             4 minute intervals for 15 day period of time.
 
     Returns:
         avg_speed (float): The average speed of the ISS during this period.
     """
-    #calculating the average by summing up the speed of the ISS at each timestep then dividing by the number of timesteps
-    total = 0.
     if len(a_dict)<=1:
-        raise ValueError('List must have length >= 1\n')
         logging.error(f'encountered a list of length 1 or less\n')
-    for item in a_dict:
+        raise ValueError('List must have length >= 1\n')
+    if not isinstance(a_dict, StateVectorStore):
         try:
-            total += speed(item)
-        except TypeError:
-            raise TypeError('non-float value\n')
-            logging.warning(f'encountered non-float value in {a_dict} in avg_speed()\n')
+            a_dict = StateVectorStore.from_state_vectors(a_dict)
         except ValueError:
+            logging.warning(f'encountered null or non-float value in avg_speed()\n')
             raise ValueError('null value\n')
-            logging.warning(f'encountered null value in {a_dict} in avg_speed()\n')
-    avg_speed = float(total/len(a_dict))
-    return avg_speed
+    #calculating the average of the speeds at every timestep in a single array operation
+    return float(speeds(a_dict).mean())
+
+
+@functools.lru_cache(maxsize = None)
+def load_astropy():
+    """
+    A function that imports astropy on first use and sets where it gets its
+    Earth orientation and leap second tables from. Unless
+    ISS_IERS_AUTO_DOWNLOAD is set, astropy never goes to the network for
+    them: it uses the tables installed with it (the astropy-iers-data
+    package), or the IERS-A file at ISS_IERS_TABLE, and only warns if the
+    ISS data runs past the end of the table.
+
+    Returns:
+        coordinates (module): astropy.coordinates
+        units (module): astropy.units
+        Time (class): astropy.time.Time
+    """
+    with span('import'):
+        from astropy import coordinates
+        from astropy import units
+        from astropy.time import Time
+        from astropy.utils import iers
+        iers.conf.auto_download = IERS_AUTO_DOWNLOAD
+        if not IERS_AUTO_DOWNLOAD:
+            iers.conf.iers_degraded_accuracy = 'warn'
+        if IERS_TABLE:
+            iers.earth_orientation_table.set(iers.IERS_A.open(IERS_TABLE))
+    return coordinates, units, Time
+
+def geodetic(positions, seconds):
+    """
+    A function that converts GCRS (J2000) positions to latitude, longitude
+    and altitude with a single vectorized astropy transform.
+
+    Args:
+        positions (numpy array): X, Y, Z positions in km, shape (N, 3).
+        seconds (numpy array): The epoch of each position as seconds since
+                               1970-01-01 UTC, shape (N,).
+
+    Returns:
+        lat (numpy array): Latitudes in degrees.
+        lon (numpy array): Longitudes in degrees.
+        alt (numpy array): Altitudes above the Earth's surface in km.
+    """
+    coordinates, units, Time = load_astropy()
+    with span('transform'):
+        obstime = Time(seconds, format='unix', scale='utc')
+        #convert from cartesion to itrs reference frame (the reference frame used by gps for latitute and longitude) for every epoch at once
+        cartesian_coord = coordinates.CartesianRepresentation(np.asarray(positions, dtype=np.float64).T, unit = units.km)
+        gcrs = coordinates.GCRS(cartesian_coord, obstime=obstime)
+        itrs = gcrs.transform_to(coordinates.ITRS(obstime=obstime))
+        curr_loc = coordinates.EarthLocation(*itrs.cartesian.xyz)
+        return curr_loc.lat.to_value(units.deg), curr_loc.lon.to_value(units.deg), curr_loc.height.to_value(units.km)
+
+class GroundTrack:
+    """
+    The latitude, longitude and altitude of the ISS at every epoch of a
+    StateVectorStore, computed in one vectorized transform.
+
+    Args:
+        vectors (StateVectorStore): The state vectors.
+    """
+    def __init__(self, vectors):
+        self.lat, self.lon, self.alt = geodetic(vectors.positions, vectors.seconds)
+
+    @classmethod
+    def from_arrays(cls, lat, lon, alt):
+        """
+        Builds a GroundTrack from latitudes, longitudes and altitudes that
+        were already computed (for example, read from a Snapshot).
+        """
+        track = cls.__new__(cls)
+        track.lat, track.lon, track.alt = lat, lon, alt
+        return track
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __getitem__(self, i):
+        return float(self.lat[i]), float(self.lon[i]), float(self.alt[i])
+
+class HermiteInterpolator:
+    """
+    Hermite interpolation of the ISS state between samples of the ephemeris.
+    Between each pair of neighbouring epochs the position is a polynomial
+    that matches both the positions and the velocities of the `points`
+    nearest samples (a degree 7 polynomial for the default of 4), and the
+    velocity is its derivative. The coefficients of every interval are
+    solved for once, in a single batched call, when the interpolator is
+    built.
+
+    Args:
+        vectors (StateVectorStore): The state vectors, in increasing epoch
+                                    order.
+        points (int): How many neighbouring samples each interval uses.
+    """
+    def __init__(self, vectors, points = 4):
+        n = len(vectors)
+        if n < 2:
+            raise ValueError('at least two state vectors are needed to interpolate\n')
+        k = min(points, n)
+        self.seconds = vectors.seconds
+        self.start = vectors.seconds[:-1]
+        self.step = np.diff(vectors.seconds)
+        if (self.step <= 0).any():
+            raise ValueError('state vector epochs must be strictly increasing to interpolate\n')
+
+        #the samples used by each interval: the k nearest, centred on the interval where possible
+        first = np.clip(np.arange(n-1) - (k//2 - 1), 0, n-k)
+        nodes = first[:, None] + np.arange(k)
+        #times are scaled so each interval runs from 0 to 1, which keeps the systems well conditioned
+        tau = (vectors.seconds[nodes] - self.start[:, None]) / self.step[:, None]
+        powers = np.arange(2*k)
+        value_rows = tau[..., None]**powers
+        slope_rows = powers * tau[..., None]**np.maximum(powers - 1, 0)
+        matrix = np.concatenate([value_rows, slope_rows], axis=1)
+        rhs = np.concatenate([vectors.positions[nodes], vectors.velocities[nodes]*self.step[:, None, None]], axis=1)
+        self.coefficients = np.linalg.solve(matrix, rhs)
+
+    @classmethod
+    def from_coefficients(cls, seconds, coefficients):
+        """
+        Builds a HermiteInterpolator from coefficients that were already
+        solved for (for example, read from a Snapshot).
+        """
+        interpolator = cls.__new__(cls)
+        interpolator.seconds = seconds
+        interpolator.start = seconds[:-1]
+        interpolator.step = np.diff(seconds)
+        interpolator.coefficients = coefficients
+        return interpolator
+
+    def __call__(self, seconds):
+        """
+        Evaluates the interpolated state at one or many times.
+
+        Args:
+            seconds (float or numpy array): Times as seconds since
+                                            1970-01-01 UTC.
+
+        Returns:
+            positions (numpy array): Positions in km, shape (M, 3).
+            velocities (numpy array): Velocities in km/s, shape (M, 3).
+        """
+        seconds = np.atleast_1d(np.asarray(seconds, dtype=np.float64))
+        if ((seconds < self.seconds[0]) | (seconds > self.seconds[-1])).any():
+            raise ValueError(f'time is outside the ephemeris, which runs from {seconds_to_epoch(self.seconds[0])} to {seconds_to_epoch(self.seconds[-1])}\n')
+        with span('interpolate'):
+            i = np.clip(np.searchsorted(self.seconds, seconds, side='right') - 1, 0, len(self.start) - 1)
+            tau = ((seconds - self.start[i]) / self.step[i])[:, None]
+            c = self.coefficients[i]
+            #Horner's method for the polynomial and its derivative
+            positions = c[:, -1]
+            slopes = np.zeros_like(positions)
+            for j in range(c.shape[1] - 2, -1, -1):
+                slopes = slopes*tau + positions
+                positions = positions*tau + c[:, j]
+            return positions, slopes / self.step[i][:, None]
+
+#the WGS84 ellipsoid (equatorial radius in km and flattening), which astropy's geodetic coordinates are on
+WGS84_A = 6378.137
+WGS84_F = 1/298.257223563
+
+def ecef(lat, lon, alt):
+    """
+    A function that converts geodetic latitudes, longitudes and altitudes to
+    Earth-fixed (ITRS) cartesian coordinates on the WGS84 ellipsoid.
+
+    Args:
+        lat (numpy array): Latitudes in degrees.
+        lon (numpy array): Longitudes in degrees.
+        alt (numpy array): Altitudes above the ellipsoid in km.
+
+    Returns:
+        positions (numpy array): X, Y, Z in km, shape (N, 3).
+        up (numpy array): The unit vector pointing straight up at each point,
+                          shape (N, 3).
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    e2 = WGS84_F*(2 - WGS84_F)
+    n = WGS84_A/np.sqrt(1 - e2*np.sin(lat)**2)
+    up = np.stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)], axis=-1)
+    positions = np.stack([(n + alt)*up[..., 0], (n + alt)*up[..., 1], (n*(1 - e2) + alt)*up[..., 2]], axis=-1)
+    return positions, up
+
+class ItrsInterpolator:
+    """
+    Interpolation of the ISS position in the Earth-fixed ITRS frame between
+    epochs. The positions at the epochs are those of the ground track, and
+    between each pair of neighbouring epochs every coordinate is the
+    polynomial through the `points` nearest positions (degree 7 for the
+    default of 8). The coefficients of every interval are solved for once,
+    in a single batched call, when the interpolator is built.
+
+    Args:
+        vectors (StateVectorStore): The state vectors, in increasing epoch
+                                    order.
+        track (GroundTrack): Their ground track.
+        points (int): How many neighbouring positions each interval uses.
+    """
+    def __init__(self, vectors, track, points = 8):
+        n = len(vectors)
+        if n < 2:
+            raise ValueError('at least two state vectors are needed to interpolate\n')
+        k = min(points, n)
+        self.seconds = vectors.seconds
+        self.start = vectors.seconds[:-1]
+        self.step = np.diff(vectors.seconds)
+        self.positions, _ = ecef(track.lat, track.lon, track.alt)
+        self.altitude = float(np.max(track.alt))
+        first = np.clip(np.arange(n-1) - (k//2 - 1), 0, n-k)
+        nodes = first[:, None] + np.arange(k)
+        tau = (self.seconds[nodes] - self.start[:, None]) / self.step[:, None]
+        self.coefficients = np.linalg.solve(tau[..., None]**np.arange(k), self.positions[nodes])
+
+    def at(self, interval, tau):
+        """
+        Evaluates the position at the same fractions of the way through each
+        of the given intervals.
+
+        Args:
+            interval (numpy array): Index of each interval (the epoch it
+                                    starts at), shape (K,).
+            tau (numpy array): How far through the interval (0 to 1) each
+                               point is, shape (S,).
+
+        Returns:
+            positions (numpy array): X, Y, Z in km, shape (K, S, 3).
+        """
+        #one batched matrix product of the coefficients with the powers of tau
+        powers = np.asarray(tau, dtype=np.float64)[:, None]**np.arange(self.coefficients.shape[1])
+        return np.matmul(self.coefficients[interval].transpose(0, 2, 1), powers.T).transpose(0, 2, 1)
+
+    def __call__(self, seconds):
+        """
+        Evaluates the position at the given times.
+
+        Args:
+            seconds (numpy array): Times as seconds since 1970-01-01 UTC.
+
+        Returns:
+            positions (numpy array): X, Y, Z in km, shape (M, 3).
+        """
+        seconds = np.atleast_1d(np.asarray(seconds, dtype=np.float64))
+        interval = np.clip(np.searchsorted(self.seconds, seconds, side='right') - 1, 0, len(self.start) - 1)
+        tau = (seconds - self.start[interval]) / self.step[interval]
+        return np.einsum('kj,kjc->kc', tau[:, None]**np.arange(self.coefficients.shape[1]), self.coefficients[interval])
+
+def sine_elevation(positions, where, up):
+    #sine of the elevation of the ISS above each observer's horizon (positions, where and up broadcast against each other)
+    offset = positions - where
+    return np.einsum('...c,...c->...', offset, up) / np.sqrt(np.einsum('...c,...c->...', offset, offset))
 
+def regula_falsi(function, t0, v0, t1, v1, steps = 3):
+    """
+    A function that narrows down, for many intervals at once, the time a
+    smooth function crosses zero, given its values v0 and v1 (of opposite
+    signs) at the ends t0 and t1 of each interval.
+
+    Args:
+        function (function): Evaluates the function at an array of times.
+        t0, v0, t1, v1 (numpy arrays): The intervals and the values at
+                                       their ends.
+        steps (int): Number of times each interval is narrowed down.
+
+    Returns:
+        seconds (numpy array): The estimated crossing time of each interval.
+    """
+    for _ in range(steps):
+        t = t0 - (t1 - t0)*v0/(v1 - v0)
+        v = function(t)
+        same = (v < 0) == (v0 < 0)
+        t0, v0 = np.where(same, t, t0), np.where(same, v, v0)
+        t1, v1 = np.where(same, t1, t), np.where(same, v1, v)
+    return t0 - (t1 - t0)*v0/(v1 - v0)
+
+#number of candidate intervals whose elevations are refined at once, which bounds the memory find_passes uses
+PASS_CHUNK = 16384
+
+def find_passes(dataset, observers, min_elevation = 10., samples = 8):
+    """
+    A function that predicts the passes of the ISS over many observers
+    within the ephemeris: when it rises above `min_elevation`, when it is
+    highest, and when it sets below it again.
+
+    The distance from every observer to the ISS at every epoch is computed
+    at once from the Earth-fixed positions of the ground track. Only the
+    intervals between epochs in which the ISS could come close enough to be
+    above `min_elevation` (judged conservatively, so no pass is missed) are
+    looked at more closely: the elevation is evaluated at `samples` points
+    along each of them from the interpolated position, and each rise, set
+    and culmination is then narrowed down from those.
+
+    Args:
+        dataset (OEMDataset): The ISS data.
+        observers (array-like): Latitude and longitude in degrees, and
+                                optionally altitude in km, of each observer,
+                                shape (M, 2) or (M, 3).
+        min_elevation (float): Elevation in degrees above the horizon the ISS
+                               has to reach.
+        samples (int): Points each candidate interval is split into.
+
+    Returns:
+        passes (list): For each observer a list of (rise, culmination, set,
+                       max_elevation) tuples, with the times in seconds since
+                       1970-01-01 UTC and the elevation in degrees. Rise is
+                       None for a pass already under way when the ephemeris
+                       starts, and set is None for one still under way when
+                       it ends.
+    """
+    observers = np.atleast_2d(np.asarray(observers, dtype=np.float64))
+    if observers.ndim != 2 or observers.shape[1] not in (2, 3):
+        raise ValueError('observers must be given as latitude, longitude and optionally altitude\n')
+    if not np.isfinite(observers).all():
+        raise ValueError('observer coordinates must be finite numbers\n')
+    if (np.abs(observers[:, 0]) > 90).any():
+        raise ValueError('observer latitudes must be between -90 and 90 degrees\n')
+    if not 0 <= min_elevation < 90:
+        raise ValueError('the minimum elevation must be at least 0 and less than 90 degrees\n')
+    if observers.shape[1] == 2:
+        observers = np.column_stack([observers, np.zeros(len(observers))])
+    with span('passes'):
+        itrs = dataset.itrs
+        where, up = ecef(observers[:, 0], observers[:, 1], observers[:, 2])
+        threshold = np.sin(np.radians(min_elevation))
+        p = itrs.positions
+
+        #distance from every observer to the ISS at every epoch, as one matrix product (|p - o|^2 = |p|^2 - 2 p.o + |o|^2)
+        distance = np.sqrt(np.maximum((p**2).sum(1)[None, :] - 2*where @ p.T + (where**2).sum(1)[:, None], 0))
+        #the farthest the ISS can be while above min_elevation, for a round Earth as large as the equator, the highest altitude in the
+        #data plus 20 km and an elevation 2 degrees lower, so the ellipsoid and the tilt of the local vertical cannot make it miss a pass
+        angle = np.radians(max(min_elevation - 2., 0.))
+        height = itrs.altitude + 20.
+        reach = -WGS84_A*np.sin(angle) + np.sqrt((WGS84_A*np.sin(angle))**2 + 2*WGS84_A*height + height**2)
+        #how far the ISS travels in each interval (10% more than the straight line between its ends, which is within 0.3% of the arc)
+        travel = 1.1*np.linalg.norm(np.diff(p, axis=0), axis=1)
+        #the closest the ISS can get to the observer during each interval, given how far it is at both ends
+        closest = (distance[:, :-1] + distance[:, 1:] - travel)/2
+        observer, interval = np.nonzero(closest <= reach)
+
+        #the elevation at evenly spaced points through every candidate interval
+        tau = np.linspace(0., 1., samples + 1)
+        sines = np.empty((len(interval), samples + 1))
+        for i in range(0, len(interval), PASS_CHUNK):
+            part = slice(i, i + PASS_CHUNK)
+            sines[part] = sine_elevation(itrs.at(interval[part], tau), where[observer[part], None], up[observer[part], None])
+        times = itrs.start[interval, None] + itrs.step[interval, None]*tau
+
+        #lay the points out in time order per observer, with consecutive intervals sharing the point where they meet
+        continues = np.r_[False, (observer[1:] == observer[:-1]) & (interval[1:] == interval[:-1] + 1)]
+        keep = np.ones(sines.shape, dtype=bool)
+        keep[:, 0] = ~continues
+        first = np.zeros(sines.shape, dtype=bool)
+        first[:, 0] = ~continues
+        sines, times, first = sines[keep], times[keep], first[keep]
+        owner = np.repeat(observer, keep.sum(1))
+        last = np.r_[first[1:], True]
+        above = sines >= threshold
+        rises = np.flatnonzero(above & (first | ~np.r_[False, above[:-1]]))
+        sets = np.flatnonzero(above & (last | ~np.r_[above[1:], False]))
+
+        def exact(seconds, who):
+            return sine_elevation(itrs(seconds), where[who], up[who])
+
+        def crossing(k0, k1, who):
+            #the time the elevation crosses min_elevation between points k0 and k1
+            return regula_falsi(lambda t: exact(t, who) - threshold, times[k0], sines[k0] - threshold, times[k1], sines[k1] - threshold)
+
+        who = owner[rises]
+        #a pass can only be under way at the first (last) point of a run of intervals at the very start (end) of the ephemeris
+        open_start = first[rises]
+        open_end = last[sets]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rise = np.where(open_start, times[rises], crossing(np.where(open_start, rises, rises - 1), rises, who))
+            fall = np.where(open_end, times[sets], crossing(sets, np.where(open_end, sets, sets + 1), who))
+
+        #the highest point of each pass, refined with the vertex of the parabola through it and its neighbours
+        members = np.flatnonzero(above)
+        number = np.searchsorted(rises, members, side='right') - 1
+        order = np.lexsort((-sines[members], number))
+        peak = members[order[np.r_[0, np.flatnonzero(np.diff(number[order])) + 1]]] if len(members) else members
+        k0 = np.where(first[peak], peak, peak - 1)
+        k2 = np.where(last[peak], peak, peak + 1)
+        t0, t1, t2 = times[k0], times[peak], times[k2]
+        v0, v1, v2 = sines[k0], sines[peak], sines[k2]
+        denominator = (t1 - t0)*(v1 - v2) - (t1 - t2)*(v1 - v0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vertex = t1 - 0.5*((t1 - t0)**2*(v1 - v2) - (t1 - t2)**2*(v1 - v0)) / denominator
+        vertex = np.where((denominator != 0) & (vertex > t0) & (vertex < t2), vertex, t1)
+        top = exact(vertex, who)
+        better = top > v1
+        culmination = np.where(better, vertex, t1)
+        highest = np.degrees(np.arcsin(np.clip(np.where(better, top, v1), -1, 1)))
+
+    #passes cut off by the start or end of the ephemeris have no rise or set time
+    rise = np.where(open_start & (times[rises] <= itrs.seconds[0]), np.nan, rise)
+    fall = np.where(open_end & (times[sets] >= itrs.seconds[-1]), np.nan, fall)
+    passes = [[] for _ in range(len(observers))]
+    for i, r, c, f, h in zip(who.tolist(), rise.tolist(), culmination.tolist(), fall.tolist(), highest.tolist()):
+        passes[i].append((None if r != r else r, c, None if f != f else f, h))
+    return passes
+
+#radius of the Sun in km
+SUN_RADIUS = 696000.0
+
+def sun_positions(seconds):
+    """
+    A function that finds the position of the Sun relative to the Earth at
+    many times with a single vectorized astropy call.
+
+    Args:
+        seconds (numpy array): Times as seconds since 1970-01-01 UTC.
+
+    Returns:
+        positions (numpy array): GCRS (J2000) X, Y, Z of the Sun in km,
+                                 shape (N, 3).
+    """
+    if len(seconds) == 0:
+        return np.zeros((0, 3))
+    coordinates, units, Time = load_astropy()
+    with span('transform'):
+        return coordinates.get_sun(Time(seconds, format='unix', scale='utc')).cartesian.xyz.to_value(units.km).T
+
+def shadow(positions, sun):
+    """
+    A function that measures how deep the ISS is in the Earth's shadow, from
+    the apparent sizes of the Sun and the Earth seen from the ISS and the
+    angle between their centres.
+
+    Args:
+        positions (numpy array): GCRS positions of the ISS in km, shape (N, 3).
+        sun (numpy array): GCRS positions of the Sun in km, shape (N, 3).
+
+    Returns:
+        penumbra (numpy array): Radians the ISS is outside the penumbra
+                                (negative inside it, or inside the umbra).
+        umbra (numpy array): Radians the ISS is outside the umbra (negative
+                             inside it).
+    """
+    #stretching space along the Earth's axis turns the Earth into a sphere of its equatorial radius, without changing where shadows fall
+    stretch = np.array([1., 1., 1/(1 - WGS84_F)])
+    positions = positions*stretch
+    to_sun = sun*stretch - positions
+    distance = np.sqrt(np.einsum('ij,ij->i', positions, positions))
+    sun_distance = np.sqrt(np.einsum('ij,ij->i', to_sun, to_sun))
+    sun_radius = np.arcsin(SUN_RADIUS/sun_distance)
+    earth_radius = np.arcsin(np.minimum(WGS84_A/distance, 1))
+    separation = np.arccos(np.clip(-np.einsum('ij,ij->i', positions, to_sun)/(distance*sun_distance), -1, 1))
+    return separation - (earth_radius + sun_radius), separation - (earth_radius - sun_radius)
+
+class Illumination:
+    """
+    Whether the ISS is sunlit, in the penumbra or in the umbra of the Earth
+    at every epoch, the beta angle (the angle between the orbit plane and
+    the direction of the Sun) at every epoch, and the times the ISS enters
+    and leaves the shadow.
+
+    The state and beta angle come straight from the sampled state vectors.
+    For the entry and exit times, each interval between epochs is split
+    into `samples` points along the interpolated orbit (so no shadow
+    crossing is missed), and each crossing is then narrowed down with
+    regula falsi. The Earth is an ellipsoid without an atmosphere.
+
+    Args:
+        vectors (StateVectorStore): The state vectors, in increasing epoch
+                                    order.
+        interpolator (HermiteInterpolator): Their interpolator.
+        sun (numpy array): The position of the Sun at every epoch, as from
+                           sun_positions.
+        samples (int): Points each interval between epochs is split into.
+    """
+    STATES = ('sunlit', 'penumbra', 'umbra')
+
+    def __init__(self, vectors, interpolator, sun, samples = 4):
+        with span('illumination'):
+            penumbra, umbra = shadow(vectors.positions, sun)
+            self.state = np.where(umbra < 0, 2, np.where(penumbra < 0, 1, 0)).astype(np.int8)
+            normal = np.cross(vectors.positions, vectors.velocities)
+            sine = np.einsum('ij,ij->i', normal, sun)/(np.linalg.norm(normal, axis=1)*np.linalg.norm(sun, axis=1))
+            self.beta = np.degrees(np.arcsin(np.clip(sine, -1, 1)))
+
+            #the Sun moves so little between epochs that it is interpolated linearly
+            def edges(seconds):
+                positions, _ = interpolator(seconds)
+                return shadow(positions, np.column_stack([np.interp(seconds, vectors.seconds, sun[:, i]) for i in range(3)]))
+
+            times = np.r_[(interpolator.start[:, None] + interpolator.step[:, None]*np.arange(samples)/samples).ravel(), vectors.seconds[-1]]
+            crossings = []
+            for which, values in enumerate(edges(times)):
+                k = np.flatnonzero((values[:-1] < 0) != (values[1:] < 0))
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    found = regula_falsi(lambda t: edges(t)[which], times[k], values[k], times[k+1], values[k+1])
+                #a crossing is an entry if the ISS is in the shadow after it
+                crossings.append((found, values[k+1] < 0, values[0] < 0))
+
+        #pairs each entry into the penumbra with the next exit, and finds the umbra entry and exit in between
+        (times, entering, inside), (umbra_times, umbra_entering, umbra_inside) = crossings
+        entries, exits = times[entering].tolist(), times[~entering].tolist()
+        if inside:
+            entries.insert(0, None)
+        if len(exits) < len(entries):
+            exits.append(None)
+        umbra_entries, umbra_exits = umbra_times[umbra_entering], umbra_times[~umbra_entering]
+        self.eclipses = []
+        for entry, leave in zip(entries, exits):
+            lo = -math.inf if entry is None else entry
+            hi = math.inf if leave is None else leave
+            inner = umbra_entries[(umbra_entries >= lo) & (umbra_entries <= hi)]
+            outer = umbra_exits[(umbra_exits >= lo) & (umbra_exits <= hi)]
+            self.eclipses.append((entry, float(inner[0]) if len(inner) else None, float(outer[0]) if len(outer) else None, leave))
+
+    @classmethod
+    def from_arrays(cls, state, beta, eclipses):
+        """
+        Builds an Illumination from states, beta angles and an eclipse table
+        that were already computed (for example, read from a Snapshot). The
+        table has one row of entry, umbra entry, umbra exit and exit times
+        per eclipse, with NaN for the missing ones.
+        """
+        illumination = cls.__new__(cls)
+        illumination.state, illumination.beta = state, beta
+        illumination.eclipses = [tuple(None if t != t else t for t in row) for row in eclipses.tolist()]
+        return illumination
+
+    def __getitem__(self, i):
+        return self.STATES[self.state[i]], float(self.beta[i])
 
 def find_location(a_dict):
     """
-    A function that calculates speed of an object.
+    A function that calculates the location of the ISS for one state vector.
 
     Args:
         a_dict (dictionary): A singular dictionary object (representing a
@@ -127,167 +2096,774 @@ def find_location(a_dict):
     x = float(a_dict['X']['#text'])
     y = float(a_dict['Y']['#text'])
     z = float(a_dict['Z']['#text'])
+    lat, lon, alt = geodetic([[x, y, z]], [epoch_to_seconds(a_dict['EPOCH'])])
+    return str(lat[0]), str(lon[0]), str(alt[0])
 
-    #reformats epoch variables (assuming epoch is in the correct format as consistent with other instances, 'YYYY-DDDThh:mm:ss.tttZ', where YYYY is the 4-digit year, DDD is the day of the year (out of 365), hh is the hour, mm is the minute, ss is the second, ttt is the time zone offset from UTC (if 000, then the epoch is in UTC time zone)). 
-    curr_time = time.strftime('%Y-%m-%d %H:%m:%S', time.strptime(a_dict['EPOCH'][:-5], '%Y-%jT%H:%M:%S'))
 
-    #convert from cartesion to itrs reference frame (the reference frame used by gps for latitute and longitude)
-    cartesian_coord = coordinates.CartesianRepresentation([x, y, z], unit = units.km)
-    gcrs = coordinates.GCRS(cartesian_coord, obstime=curr_time)
-    itrs = gcrs.transform_to(coordinates.ITRS(obstime=curr_time))
-    curr_loc = coordinates.EarthLocation(*itrs.cartesian.xyz)
-    
-    return str(curr_loc.lat.value), str(curr_loc.lon.value), str(curr_loc.height.value)
-      
+#which reverse geocoder the location routes use ('gazetteer' works offline, 'nominatim' asks the public Nominatim service), where the offline gazetteer is, and how finely (in degrees) coordinates are rounded before looking them up
+GEOCODER = os.environ.get('ISS_GEOCODER', 'gazetteer')
+GAZETTEER_PATH = os.environ.get('ISS_GAZETTEER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv'))
+COUNTRIES_PATH = os.environ.get('ISS_COUNTRIES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'countries.geojson'))
+GEOCODE_PRECISION = float(os.environ.get('ISS_GEOCODE_PRECISION', '0.01'))
+NOMINATIM_DELAY = float(os.environ.get('ISS_NOMINATIM_DELAY', '1.0'))
+EARTH_RADIUS = 6371.0
+
+def great_circle_km(lat1, lon1, lat2, lon2):
+    """
+    A function that calculates the great-circle (haversine) distance in km
+    between points given in degrees. Works element-wise on numpy arrays.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.minimum(a, 1.)))
+
+class Place:
+    """
+    A reverse geocoding result, with the same attributes the location routes
+    use from a geopy Location.
+
+    Args:
+        address (string): The name of the place.
+        latitude (float): The latitude of the place.
+        longitude (float): The longitude of the place.
+    """
+    def __init__(self, address, latitude, longitude):
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+class CountryMap:
+    """
+    The countries of the world as polygons, used to tell land from water.
+    A point is inside a country if a ray from it crosses the edges of the
+    country's rings an odd number of times (so holes, like Lesotho inside
+    South Africa, are left out), and only countries whose bounding box
+    holds the point are looked at.
+
+    The bundled countries.geojson is the public domain Natural Earth 1:110m
+    admin-0 countries set, with the ISO 3166 alpha-2 code GeoNames uses for
+    each country in an "iso_a2" property. Any GeoJSON file of Polygon or
+    MultiPolygon features with a "name" (and optionally "iso_a2") property
+    can be used instead.
+
+    Args:
+        path (string): Location of the GeoJSON file.
+    """
+    def __init__(self, path = COUNTRIES_PATH):
+        with open(path, encoding='utf-8') as f:
+            features = json.load(f)['features']
+        self.names = []
+        self.codes = []
+        bounds, starts, edges = [], [0], []
+        for feature in features:
+            geometry = feature['geometry']
+            polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            rings = [np.asarray(ring, dtype=np.float64) for polygon in polygons for ring in polygon]
+            points = np.concatenate(rings)
+            #every edge of every ring, as lon1, lat1, lon2, lat2
+            edges += [np.hstack([ring[:-1], ring[1:]]) for ring in rings]
+            starts.append(starts[-1] + sum(len(ring) - 1 for ring in rings))
+            bounds.append((points[:, 1].min(), points[:, 1].max(), points[:, 0].min(), points[:, 0].max()))
+            self.names.append(feature['properties']['name'])
+            self.codes.append(feature['properties'].get('iso_a2'))
+        self.bounds = np.array(bounds)
+        self.starts = starts
+        self.edges = np.concatenate(edges)
+
+    def country(self, lat, lon):
+        """
+        Returns the name of the country at the given coordinates, or None
+        if they are above water.
+        """
+        i = self.find(lat, lon)
+        return None if i is None else self.names[i]
+
+    def find(self, lat, lon):
+        """
+        Returns the index of the country at the given coordinates (into
+        names and codes), or None if they are above water.
+        """
+        lat, lon = float(lat), (float(lon) + 180) % 360 - 180
+        inside = (self.bounds[:, 0] <= lat) & (lat <= self.bounds[:, 1]) & (self.bounds[:, 2] <= lon) & (lon <= self.bounds[:, 3])
+        for i in np.flatnonzero(inside):
+            x1, y1, x2, y2 = self.edges[self.starts[i]:self.starts[i+1]].T
+            straddles = (y1 > lat) != (y2 > lat)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossings = straddles & (lon < x1 + (lat - y1)*(x2 - x1)/(y2 - y1))
+            if crossings.sum() % 2:
+                return int(i)
+        return None
+
+class GazetteerGeocoder:
+    """
+    An offline reverse geocoder over a local gazetteer and a CountryMap.
+    A point outside every country (and not within `coast` km of a place) is
+    above a body of water. A point on land is named after the nearest place
+    of the gazetteer in the same country that covers it (every place covers
+    the area within its radius), or otherwise after the country it is in.
+    Countries are matched by ISO 3166 alpha-2 code, and places without a
+    code are taken to be in any country. Places are bucketed into a grid of `cell`-degree cells
+    so a lookup only measures the distance to places in nearby cells.
+
+    The gazetteer is either a CSV file with the columns name, region,
+    country, latitude, longitude, radius_km and country_code (see
+    gazetteer.csv), or a
+    GeoNames dump such as cities15000.txt, whose places all get
+    `default_radius` km.
+
+    Args:
+        path (string): Location of the gazetteer file.
+        cell (float): Size of the grid cells in degrees.
+        default_radius (float): Radius in km for places with no radius.
+        countries (string): Location of the country polygons (see
+                            CountryMap).
+        coast (float): Distance in km from a place within which a point
+                       counts as land even outside every country polygon.
+    """
+    def __init__(self, path = GAZETTEER_PATH, cell = 5.0, default_radius = 100., countries = COUNTRIES_PATH, coast = 25.):
+        self.countries = CountryMap(countries)
+        self.coast = coast
+        addresses, lats, lons, radii, codes = [], [], [], [], []
+        with open(path, newline='', encoding='utf-8') as f:
+            if path.endswith('.txt'):
+                #GeoNames columns: name is 1, latitude 4, longitude 5, country code 8, admin1 code 10
+                for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    addresses.append(', '.join(part for part in (row[1], row[10], row[8]) if part))
+                    lats.append(float(row[4]))
+                    lons.append(float(row[5]))
+                    radii.append(default_radius)
+                    codes.append(row[8])
+            else:
+                for row in csv.DictReader(f):
+                    addresses.append(', '.join(part for part in (row['name'], row.get('region'), row.get('country')) if part))
+                    lats.append(float(row['latitude']))
+                    lons.append(float(row['longitude']))
+                    radii.append(float(row.get('radius_km') or default_radius))
+                    codes.append(row.get('country_code') or '')
+        self.addresses = addresses
+        self.lat = np.array(lats)
+        self.lon = np.array(lons)
+        self.radius = np.array(radii)
+        self.codes = np.array(codes)
+        self.cell = cell
+        self.columns = int(math.ceil(360/cell))
+        self.max_radius = float(self.radius.max()) if len(self.radius) else 0.
+
+        #bucket every place into its grid cell
+        cells = {}
+        for i, key in enumerate(zip(*self.cell_of(self.lat, self.lon))):
+            cells.setdefault(key, []).append(i)
+        self.grid = {key: np.array(value) for key, value in cells.items()}
+
+    def cell_of(self, lat, lon):
+        """
+        Returns the grid row and column of the given coordinates.
+        """
+        row = np.floor((np.asarray(lat) + 90) / self.cell).astype(int)
+        column = np.floor((np.asarray(lon) + 180) / self.cell).astype(int) % self.columns
+        return row.tolist(), column.tolist()
+
+    def candidates(self, lat, lon):
+        """
+        Returns the places in the grid cells that are within max_radius of
+        the given coordinates.
+        """
+        reach = self.max_radius / (EARTH_RADIUS*math.pi/180)
+        row, column = self.cell_of(lat, lon)
+        rows = int(math.ceil(reach / self.cell))
+        #near the poles a small distance spans many degrees of longitude
+        widest = min(abs(lat) + reach, 90.)
+        if widest >= 89.:
+            columns = range(self.columns)
+        else:
+            span = int(math.ceil(reach / math.cos(math.radians(widest)) / self.cell))
+            columns = range(column - span, column + span + 1) if 2*span + 1 < self.columns else range(self.columns)
+        found = [self.grid[key] for key in ((r, c % self.columns) for r in range(row - rows, row + rows + 1) for c in columns) if key in self.grid]
+        return np.concatenate(found) if found else np.array([], dtype=int)
+
+    def reverse(self, lat, lon):
+        """
+        Finds what is at the given coordinates.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+
+        Returns:
+            place (Place): The nearest place in the same country that covers
+                           the point, or the country it is in (at the point
+                           itself) if no place does, or None if it is above
+                           water.
+        """
+        found = self.countries.find(lat, lon)
+        country = None if found is None else self.countries.names[found]
+        nearby = self.candidates(lat, lon)
+        if len(nearby):
+            distance = great_circle_km(lat, lon, self.lat[nearby], self.lon[nearby])
+            if country is not None:
+                #a place across a border does not name the point, however large its radius
+                code = self.countries.codes[found]
+                covered = (distance <= self.radius[nearby]) & ((self.codes[nearby] == code) | (self.codes[nearby] == '') | (code is None))
+            else:
+                #the simplified coastline misses the edge of many coastal cities, so close to a place is on land regardless
+                covered = distance <= np.minimum(self.radius[nearby], self.coast)
+            if covered.any():
+                best = nearby[covered][np.argmin(distance[covered])]
+                return Place(self.addresses[best], float(self.lat[best]), float(self.lon[best]))
+        return None if country is None else Place(country, float(lat), float(lon))
+
+class NominatimGeocoder:
+    """
+    A reverse geocoder that asks the public Nominatim service, through one
+    shared geolocator that is rate limited to one request every `min_delay`
+    seconds. If the service cannot be reached and a fallback geocoder is
+    given, the fallback answers instead.
+
+    Args:
+        min_delay (float): Minimum number of seconds between requests.
+        fallback (GazetteerGeocoder): Optional geocoder to use when the
+                                      service is unavailable.
+    """
+    def __init__(self, min_delay = NOMINATIM_DELAY, fallback = None):
+        from geopy.extra.rate_limiter import RateLimiter
+        from geopy.geocoders import Nominatim
+        self.geolocator = Nominatim(user_agent="ISS Tracker Flask App")
+        self.lookup = RateLimiter(self.geolocator.reverse, min_delay_seconds = min_delay, max_retries = 0, swallow_exceptions = False)
+        self.fallback = fallback
+
+    def reverse(self, lat, lon):
+        """
+        Returns the geopy Location above the given coordinates, or None
+        above water.
+        """
+        from geopy.exc import GeopyError
+        try:
+            return self.lookup((lat, lon), zoom = 10, language = 'en')
+        except GeopyError as e:
+            if self.fallback is None:
+                raise
+            logging.warning(f'Nominatim unavailable ({e}), using the offline gazetteer instead\n')
+            return self.fallback.reverse(lat, lon)
+
+class ReverseGeocoder:
+    """
+    Puts an LRU cache in front of a geocoder backend. Coordinates are
+    rounded to `precision` degrees before the lookup, so nearby positions
+    share a cache entry.
+
+    Args:
+        backend (GazetteerGeocoder or NominatimGeocoder): Does the lookups.
+        precision (float): Rounding step in degrees.
+        maxsize (int): Maximum number of cached lookups.
+    """
+    def __init__(self, backend, precision = GEOCODE_PRECISION, maxsize = 4096):
+        self.backend = backend
+        self.precision = precision
+        self.lookup = functools.lru_cache(maxsize = maxsize)(self.lookup_cell)
+
+    def lookup_cell(self, lat_step, lon_step):
+        return self.backend.reverse(lat_step*self.precision, lon_step*self.precision)
+
+    def key(self, lat, lon):
+        return round(float(lat)/self.precision), round(float(lon)/self.precision)
+
+    def reverse(self, lat, lon):
+        """
+        Returns the place above the given coordinates, or None above water.
+        """
+        return self.lookup(*self.key(lat, lon))
+
+    def reverse_many(self, points):
+        """
+        Looks up many (lat, lon) points as one batch, asking the backend only
+        once for points that round to the same cache key.
+
+        Returns:
+            places (list): The place above each point (None above water).
+        """
+        keys = [self.key(lat, lon) for lat, lon in points]
+        found = {key: self.lookup(*key) for key in dict.fromkeys(keys)}
+        return [found[key] for key in keys]
+
+@functools.lru_cache(maxsize = None)
+def get_geocoder(name = GEOCODER):
+    """
+    Returns the shared ReverseGeocoder for the configured backend, creating
+    it on first use.
+    """
+    gazetteer = GazetteerGeocoder()
+    backend = NominatimGeocoder(fallback = gazetteer) if name == 'nominatim' else gazetteer
+    return ReverseGeocoder(backend)
+
+def reverse_geocode(lat, lon):
+    """
+    A function that finds what the ISS is above at the given coordinates.
+
+    Args:
+        lat (float): Latitude in degrees.
+        lon (float): Longitude in degrees.
+
+    Returns:
+        location (Place): The place (with address, latitude and longitude),
+                          or None if the ISS is above a body of water.
+    """
+    with span('geocode'):
+        return get_geocoder().reverse(lat, lon)
 
 #setting the "home" page to be the one that outputs the relevant general summary statistics
 @app.route('/', methods = ['GET'])
+@cached_response
 def main():
-    #uses requests to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    ml_data = data['ndm']['oem']['body']['segment']['data']['stateVector']
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    ml_data = data.vectors
     
-    #calculates some general summary statistics and outputs it
+    #calculates some general summary statistics and outputs it (the speeds were already computed when the snapshot was built)
     result1 = time_range(ml_data)
     result2 = currEpoch(ml_data[-1])
-    result3 = f'The average speed of the ISS for this simulation of the past 15 days was: {avg_speed(ml_data)} km/s. The current speed of the ISS is: {speed(ml_data[-1])} km/s.'
+    result3 = f'The average speed of the ISS for this simulation of the past 15 days was: {float(data.speeds.mean())} km/s. The current speed of the ISS is: {float(data.speeds[-1])} km/s.'
     return f'{result1}\n{result2}\n{result3}\n'
 
-#setting an app decorator that lists all the ISS time steps, and also has query parameters: limit & offset. Limit will limit the size of the list of the ISS epochs. Offset will offset the starting point by the i-th value in the data set
+#the formats /epochs and /groundtrack can also be sent in, chosen with the Accept header: rows of plain numbers as JSON or MessagePack
+#(if msgpack is installed), or every column as raw little-endian float64 one after the other (epochs as seconds since 1970-01-01 UTC)
+FLAT_JSON = 'application/vnd.iss.flat+json'
+MSGPACK = 'application/msgpack'
+COLUMNS = 'application/octet-stream'
+
+@functools.lru_cache(maxsize = None)
+def load_msgpack():
+    """
+    Imports msgpack on first use, returning None if it is not installed.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+def negotiate(formats) -> str:
+    """
+    A function that picks the format to answer in from the Accept header.
+
+    Args:
+        formats (list): Media types the route can answer in besides JSON
+                        (MessagePack is left out if msgpack is missing).
+
+    Returns:
+        media_type (string): The best match, or application/json if nothing
+                             matches.
+    """
+    offered = ['application/json'] + [value for value in formats if value != MSGPACK or load_msgpack() is not None]
+    return request.accept_mimetypes.best_match(offered, 'application/json')
+
+def negotiated(view):
+    """
+    A decorator for routes that answer in a format picked by negotiate. All
+    their responses carry Vary: Accept, so caches between the app and the
+    client keep one copy per format. Put it below cached_response, so the
+    header is stored with the cached entries too.
+    """
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        response = app.make_response(view(**kwargs))
+        response.vary.add('Accept')
+        return response
+    return wrapper
+
+def table_response(media_type, epochs, seconds, names, values, headers = None):
+    """
+    A function that serializes rows of numbers straight from the arrays
+    they are kept in, in one of the bulk formats.
+
+    Args:
+        media_type (string): FLAT_JSON, MSGPACK or COLUMNS.
+        epochs (numpy array): Epoch strings (bytes) of the rows.
+        seconds (numpy array): Epochs as seconds since 1970-01-01 UTC.
+        names (tuple): Name of each column of `values`.
+        values (numpy array): The numbers, shape (N, len(names)).
+        headers (dictionary): Extra response headers.
+
+    Returns:
+        response (Response): The serialized rows. COLUMNS responses name
+                             their columns in X-Columns and give the number
+                             of rows in X-Rows.
+    """
+    with span('serialize'):
+        headers = dict(headers or {})
+        if media_type == COLUMNS:
+            body = np.ascontiguousarray(np.column_stack([seconds, values]).T, dtype='<f8').tobytes()
+            headers.update({'X-Columns': ','.join(('EPOCH',) + tuple(names)), 'X-Rows': str(len(seconds))})
+            return Response(body, mimetype = COLUMNS, headers = headers)
+        keys = ('EPOCH',) + tuple(names)
+        rows = [dict(zip(keys, [epoch.decode()] + row)) for epoch, row in zip(epochs, np.asarray(values, dtype=np.float64).tolist())]
+        if media_type == MSGPACK:
+            return Response(load_msgpack().packb(rows), mimetype = MSGPACK, headers = headers)
+        return Response(json.dumps(rows, separators = (',', ':')), mimetype = FLAT_JSON, headers = headers)
+
+def encode_cursor(epoch: str) -> str:
+    """
+    A function that turns the epoch a page of /epochs should start at into
+    an opaque cursor string.
+    """
+    return base64.urlsafe_b64encode(epoch.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> float:
+    """
+    A function that turns a cursor made by encode_cursor back into the time
+    of its epoch, in seconds since 1970-01-01 UTC.
+    """
+    try:
+        #validate only accepts the standard alphabet, and rejects anything outside it instead of skipping it
+        epoch = base64.b64decode(cursor.replace('-', '+').replace('_', '/') + '='*(-len(cursor) % 4), validate=True).decode()
+        return parse_time(epoch)
+    except ValueError:
+        raise ValueError('Invalid cursor parameter; use the X-Next-Cursor header of a previous /epochs response\n')
+
+#setting an app decorator that lists all the ISS time steps, and also has query parameters: limit & offset. Limit will limit the size of the list of the ISS epochs. Offset will offset the starting point by the i-th value in the data set. Start and end (epochs or ISO-8601 timestamps) keep only the epochs between them, and step (seconds) or max_points thin them out for plotting. A cursor from the X-Next-Cursor header of a previous page continues from where that page ended, sending "Accept: application/x-ndjson" streams the rows one JSON object per line, and the Accept header can also ask for one of the bulk formats (see table_response)
 @app.route('/epochs', methods = ['GET'])
+@cached_response
+@negotiated
 def list_epochs():
-    #uses requests to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data = data['ndm']['oem']['body']['segment']['data']['stateVector']
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_data = data.vectors
 
     #stores the query parameters from the input and checks if they are valid, if not then raise errors.
     limit = request.args.get('limit', len(iss_data))
     offset = request.args.get('offset', 0)
     try:
         offset=int(offset)
+        if offset < 0:
+            raise ValueError
     except ValueError:
-        return 'Invalid start parameter; start must be a non-negative integer\n'
+        return 'Invalid offset parameter; offset must be a non-negative integer\n'
     try:
         limit = int(limit)
+        if limit < 0:
+            raise ValueError
     except ValueError:
         return 'Invalid limit parameter; limit must be a non-negative integer\n'
-    
-    #initialize a ret_data list to store the queried list, and a counter parameter to track the current size of the returned list, ret_data
-    ret_data = []
-    counter = 0
-    for i in range(len(iss_data)):
-        #check if the current index is past the offset or not
-        if i >= offset:
-            ret_data.append(iss_data[i])
-            counter += 1
-            #checks if the limit has been reached yet
-            if counter >= limit:
-                return ret_data
-    return ret_data
+    step = request.args.get('step')
+    try:
+        if step is not None:
+            step = float(step)
+            if not step > 0 or math.isinf(step):
+                raise ValueError
+    except ValueError:
+        return 'Invalid step parameter; step must be a positive number of seconds\n'
+    max_points = request.args.get('max_points')
+    try:
+        if max_points is not None:
+            max_points = int(max_points)
+            if max_points < 1:
+                raise ValueError
+    except ValueError:
+        return 'Invalid max_points parameter; max_points must be a positive integer\n'
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        lo, hi = data.index.window(None if start is None else parse_time(start), None if end is None else parse_time(end))
+    except ValueError as e:
+        return str(e)
+
+    #the time window is found by bisection and thinned out before paging, so only the epochs that are sent are touched
+    if step is None and max_points is None:
+        positions = slice(lo, hi)
+        count = hi - lo
+    else:
+        positions = data.index.sample(lo, hi, step, max_points)
+        count = len(positions)
+    seconds = data.index.seconds[positions]
+    order = data.index.order[positions]
+    #a cursor moves the starting point to the epoch it names (looked up by bisection, so it still works after the data is refreshed), and
+    #already accounts for the offset of the first page, so the offset is ignored alongside it
+    first = offset
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            first = int(np.searchsorted(seconds, decode_cursor(cursor)))
+        except ValueError as e:
+            return str(e)
+
+    #the page is a slice of the index's rows, so nothing outside the page is touched
+    rows = order[first:first + limit]
+    headers = {}
+    next_row = first + limit
+    if next_row < count:
+        headers['X-Next-Cursor'] = encode_cursor(iss_data.epoch(order[next_row]))
+
+    media_type = negotiate(['application/x-ndjson', FLAT_JSON, MSGPACK, COLUMNS])
+    if media_type == 'application/x-ndjson':
+        #streams one row at a time from a generator, so large pulls start at once and use constant memory
+        def generate():
+            for i in rows:
+                yield json.dumps(iss_data[i]) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson', headers=headers)
+    if media_type != 'application/json':
+        return table_response(media_type, iss_data.epochs[rows], iss_data.seconds[rows], COMPONENTS, np.hstack([iss_data.positions[rows], iss_data.velocities[rows]]), headers)
+    return [iss_data[i] for i in rows], headers
 
 #setting an app decorator that outputs the epoch and statevector for a speciific epoch
 @app.route('/epochs/<epoch>', methods = ['GET'])
 def specific_epoch(epoch):
-     #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data = data['ndm']['oem']['body']['segment']['data']['stateVector']
-    #parses through the dataset to check if there is an item with the matching epoch
-    for item in iss_data:
-        if item['EPOCH'] == epoch:
-            return item
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_data = data.vectors
+    #looks the epoch up in the dataset's epoch index (exact by default, or the closest sample with ?match=nearest)
+    try:
+        row = data.index.find(epoch, request.args.get('match', 'exact'))
+    except ValueError as e:
+        return str(e)
+    if row is not None:
+        return iss_data[row]
     return f'Failed to find a state vector, check if epoch was valid (in time range of this 15 day period run and in the correct format: "YYYY"-"ddd"T"hh":"mm":"ss":"ttt"Z, where YYYY is the 4-digit year, ddd is the day of the year (out of 365), hh is in hours, mm is in minutes, ss is in seconds, ttt is the time zone offset from UTC(000 if UTC)). \n'
 
 #setting an app decorator that outputs the speed of the ISS at a particular epoch
 @app.route('/epochs/<epoch>/speed', methods = ['GET'])
 def specific_epoch_speed(epoch):
-    #initilize a speed variable
-    sat_speed = -1
-    #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data = data['ndm']['oem']['body']['segment']['data']['stateVector']
-    #parses through the dataset to check if there is an item with the matching epoch, then calls the speed function to return the speed of the ISS at the input epoch time
-    for item in iss_data:
-        if item['EPOCH'] == epoch:
-            try:
-                sat_speed = speed(item)
-                return f'Speed of about ~ {int(sat_speed)} km/s\n'
-            except ValueError:
-                return 'null value\n'
-            except TypeError:
-                return 'non-float value\n'
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    #looks the epoch up in the dataset's epoch index, then reads the speed of the ISS at the input epoch time from the speeds computed for the whole dataset
+    try:
+        row = data.index.find(epoch, request.args.get('match', 'exact'))
+    except ValueError as e:
+        return str(e)
+    if row is not None:
+        sat_speed = float(data.speeds[row])
+        if not math.isfinite(sat_speed):
+            return 'null value\n'
+        return f'Speed of about ~ {int(sat_speed)} km/s\n'
     return f'Failed to find a valid state vector, check if epoch was valid (in time range of this 15 day period run\n'
 
 @app.route('/comment', methods = ['GET'])
+@cached_response
 def comment():
-    #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data_comments = data['ndm']['oem']['body']['segment']['data']['COMMENT']
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_data_comments = data.comments
     return iss_data_comments
 
 @app.route('/header', methods = ['GET'])
+@cached_response
 def header():
-    #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data_header = data['ndm']['oem']['header']
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_data_header = data.header
     return iss_data_header
 
 @app.route('/metadata', methods = ['GET'])
+@cached_response
 def metadata():
-    #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_meta_data = data['ndm']['oem']['body']['segment']['metadata']
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_meta_data = data.metadata
     return iss_meta_data    
 
 @app.route('/epochs/<epoch>/location', methods = ['GET'])
 def specific_epoch_location(epoch):
-    #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data = data['ndm']['oem']['body']['segment']['data']['stateVector']
-    for item in iss_data:
-        if item['EPOCH'] == epoch:
-            try:
-                location_info = find_location(item)
-            except ValueError:
-                raise ValueError('null value in location route\n')
-                logging.warning(f'encountered null value for epoch of {item["EPOCH"]} in location route.\n')
-    geolocator = Nominatim(user_agent="ISS Tracker Flask App")
-    location = geolocator.reverse((f"{str(location_info[0])}, {str(location_info[1])}"), zoom = 10, language ='en')
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_data = data.vectors
+    try:
+        row = data.index.find(epoch, request.args.get('match', 'exact'))
+    except ValueError as e:
+        return str(e)
+    if row is None:
+        return f'Failed to find a valid state vector, check if epoch was valid (in time range of this 15 day period run\n'
+    #the location of every epoch is computed once per dataset version in a single transform
+    location_info = [str(value) for value in data.ground_track[row]]
+    location = reverse_geocode(location_info[0], location_info[1])
     if (location == None):
         return f'The ISS is currently above a body of water, and it\'s coordinates are: {str(location_info[0])}, {str(location_info[1])}. It is also at an altitude of: {str(location_info[2])} km above the Earth\'s surface.\n'
     return f'The ISS is currently above {str(location.address)}, and it\'s coordinates are: {str(location.latitude)}, {str(location.longitude)}. It is also at an altitude of {str(location_info[2])} km above the Earth\'s surface.\n'
 
 @app.route('/now', methods = ['GET'])
 def now():
-    #uses request to pull the most recent data from ISS website and stores it
-    response = requests.get(url = 'https://nasa-public-data.s3.amazonaws.com/iss-coords/current/ISS_OEM/ISS.OEM_J2K_EPH.xml')
-    data = xmltodict.parse(response.content)
-    iss_data = data['ndm']['oem']['body']['segment']['data']['stateVector']
-    curr_StateVect = iss_data[-1]
-    try: 
-        lat, lon, alt = find_location(curr_StateVect)
-        geolocator = Nominatim(user_agent="ISS Tracker Flask App")
-        location = geolocator.reverse((lat, lon), zoom = 10, language='en')
-        sat_speed = speed(curr_StateVect)
-        if (location == None):
-            return f'The ISS is currently above a body of water, and it\'s coordinates are: {lat}, {lon}. It is also at an altitude of: {alt} km above the Earth\'s surface. It is traveling at a speed of about ~ {int(sat_speed)} km/s as of right now.\n'
-        return f'The ISS is currently above {str(location.address)}, and it\'s coordinates are: {str(location.latitude)}, {str(location.longitude)}. It is also at an altitude of {str(alt)} km above the Earth\'s surface. It is traveling at a speed of about ~ {int(sat_speed)} km/s as of right now.\n'
-    except ValueError:
-        raise ValueError('null value in location route\n')
-        logging.warning(f'encountered null value for epoch of {curr_StateVect["EPOCH"]} in location route.\n')
-    except TypeError:
-        raise TypeError('non-float value in location route\n')
-        logging.warning(f'encountered non-float value for epoch of {curr_StateVect["EPOCH"]} in location route.\n')
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    #interpolates the state vector at the actual current time rather than using the last sample of the ephemeris
+    curr_time = time.time()
+    try:
+        positions, velocities = data.interpolator(curr_time)
+    except ValueError as e:
+        return str(e)
+    lat, lon, alt = (str(value[0]) for value in geodetic(positions, [curr_time]))
+    location = reverse_geocode(lat, lon)
+    sat_speed = float(np.linalg.norm(velocities[0]))
+    if (location == None):
+        return f'The ISS is currently above a body of water, and it\'s coordinates are: {lat}, {lon}. It is also at an altitude of: {alt} km above the Earth\'s surface. It is traveling at a speed of about ~ {int(sat_speed)} km/s as of right now.\n'
+    return f'The ISS is currently above {str(location.address)}, and it\'s coordinates are: {str(location.latitude)}, {str(location.longitude)}. It is also at an altitude of {str(alt)} km above the Earth\'s surface. It is traveling at a speed of about ~ {int(sat_speed)} km/s as of right now.\n'
+
+#setting an app decorator that outputs the interpolated state vector of the ISS at any time within the ephemeris, given as ?t= (repeat t for several times)
+@app.route('/at', methods = ['GET'])
+def at():
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    times = request.args.getlist('t')
+    if not times:
+        return 'Missing t parameter; t must be an epoch like 2024-050T14:45:00.000Z or an ISO-8601 timestamp\n'
+    try:
+        seconds = np.array([parse_time(value) for value in times])
+        positions, velocities = data.interpolator(seconds)
+    except ValueError as e:
+        return str(e)
+    #returns the state vectors in the same layout as /epochs/<epoch>
+    result = []
+    for when, state in zip(seconds, np.hstack([positions, velocities])):
+        item = {'EPOCH': seconds_to_epoch(when)}
+        for key, unit, value in zip(COMPONENTS, data.vectors.units, state):
+            item[key] = {'#text': str(value)} if unit is None else {'@units': unit, '#text': str(value)}
+        result.append(item)
+    return result[0] if len(result) == 1 else result
+
+#setting an app decorator that outputs the latitude, longitude and altitude of the ISS at every epoch, optionally between a start and end time (also in the bulk formats of table_response)
+@app.route('/groundtrack', methods = ['GET'])
+@negotiated
+def groundtrack():
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    iss_data = data.vectors
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        rows = data.index.range(None if start is None else parse_time(start), None if end is None else parse_time(end))
+    except ValueError as e:
+        return str(e)
+    track = data.ground_track
+    media_type = negotiate([FLAT_JSON, MSGPACK, COLUMNS])
+    if media_type != 'application/json':
+        return table_response(media_type, iss_data.epochs[rows], iss_data.seconds[rows], ('latitude', 'longitude', 'altitude'), np.column_stack([track.lat[rows], track.lon[rows], track.alt[rows]]))
+    return [{'EPOCH': iss_data.epoch(i), 'latitude': float(track.lat[i]), 'longitude': float(track.lon[i]), 'altitude': float(track.alt[i])} for i in rows]
+
+#setting an app decorator that outputs whether the ISS is sunlit, in the penumbra or in the umbra of the Earth at a specific epoch, and the beta angle in degrees
+@app.route('/epochs/<epoch>/illumination', methods = ['GET'])
+def specific_epoch_illumination(epoch):
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    try:
+        row = data.index.find(epoch, request.args.get('match', 'exact'))
+    except ValueError as e:
+        return str(e)
+    if row is None:
+        return f'Failed to find a valid state vector, check if epoch was valid (in time range of this 15 day period run\n'
+    state, beta = data.illumination[row]
+    return {'EPOCH': data.vectors.epoch(row), 'state': state, 'beta_angle': beta}
+
+#setting an app decorator that outputs when the ISS enters and leaves the Earth's shadow, optionally between a start and end time
+@app.route('/eclipses', methods = ['GET'])
+def eclipses():
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = -math.inf if start is None else parse_time(start)
+        end = math.inf if end is None else parse_time(end)
+    except ValueError as e:
+        return str(e)
+    #an eclipse cut off by the start or end of the ephemeris has no entry or exit time
+    chosen = [times for times in data.illumination.eclipses if (times[3] is None or times[3] >= start) and (times[0] is None or times[0] <= end)]
+    epochs = seconds_to_epochs([t for times in chosen for t in times])
+    return [{'entry': epochs[4*i], 'umbra_entry': epochs[4*i + 1], 'umbra_exit': epochs[4*i + 2], 'exit': epochs[4*i + 3],
+             'duration': None if entry is None or leave is None else round(leave - entry, 3)}
+            for i, (entry, _, _, leave) in enumerate(chosen)]
+
+def parse_observer(value) -> list:
+    """
+    A function that reads one observer given as "lat,lon" or "lat,lon,alt"
+    (altitude in km), or as a list of those numbers.
+
+    Args:
+        value (string or list): The observer.
+
+    Returns:
+        observer (list): Latitude, longitude and altitude of the observer.
+    """
+    parts = value.split(',') if isinstance(value, str) else value
+    try:
+        observer = [float(part) for part in parts]
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid observer {value!r}; observers must be given as lat,lon or lat,lon,alt\n')
+    #float() also reads 'nan' and 'inf', which are not positions (and not valid JSON in the response)
+    if len(observer) not in (2, 3) or not all(math.isfinite(part) for part in observer):
+        raise ValueError(f'Invalid observer {value!r}; observers must be given as lat,lon or lat,lon,alt\n')
+    return observer + [0.] * (3 - len(observer))
+
+#setting an app decorator that outputs the passes of the ISS over one or many observers, given as ?observer=lat,lon[,alt] (repeatable)
+#or ?lat=&lon=&alt=, or POSTed as JSON {"observers": [[lat, lon, alt], ...], "min_elevation": 10}
+@app.route('/passes', methods = ['GET', 'POST'])
+def passes():
+    #reads the current snapshot of the ISS data
+    data = get_dataset()
+    try:
+        if request.method == 'POST':
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict) or not isinstance(body.get('observers'), list):
+                return 'The request body must be JSON like {"observers": [[lat, lon, alt], ...], "min_elevation": 10}\n'
+            observers = [parse_observer(value) for value in body['observers']]
+            min_elevation = float(body.get('min_elevation', 10))
+        else:
+            observers = [parse_observer(value) for value in request.args.getlist('observer')]
+            if 'lat' in request.args or 'lon' in request.args:
+                observers.append(parse_observer([request.args.get('lat'), request.args.get('lon'), request.args.get('alt', 0)]))
+            min_elevation = float(request.args.get('min_elevation', 10))
+        if not observers:
+            return 'Missing observer; give ?observer=lat,lon[,alt] (repeatable) or ?lat=&lon=&alt=\n'
+        found = find_passes(data, observers, min_elevation)
+    except (TypeError, ValueError) as e:
+        return str(e) if str(e).endswith('\n') else f'Invalid min_elevation; {e}\n'
+    #the rise, culmination and set of every pass of every observer are formatted in one go
+    epochs = iter(seconds_to_epochs([t for passes in found for rise, top, fall, _ in passes for t in (rise, top, fall)]))
+    return [{'latitude': lat, 'longitude': lon, 'altitude': alt,
+             'passes': [{'rise': next(epochs), 'culmination': next(epochs), 'set': next(epochs), 'max_elevation': round(highest, 3)} for *_, highest in found[i]]}
+            for i, (lat, lon, alt) in enumerate(observers)]
+
+def metric(lines, name, kind, description, value):
+    #appends one unlabelled metric in the Prometheus text format
+    lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {value}']
+
+#setting an app decorator that outputs the app's metrics in the Prometheus text format
+@app.route('/metrics', methods = ['GET'])
+def metrics():
+    lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render()
+    stats = feed_cache.stats()
+    metric(lines, 'iss_feed_cache_hits_total', 'counter', 'Requests for the OEM file answered from the cache.', stats['hits'])
+    metric(lines, 'iss_feed_cache_misses_total', 'counter', 'Times the OEM file was downloaded and parsed.', stats['misses'])
+    metric(lines, 'iss_feed_cache_revalidations_total', 'counter', 'Times upstream answered 304 Not Modified.', stats['revalidations'])
+    metric(lines, 'iss_feed_cache_errors_total', 'counter', 'Failed refreshes of the OEM file.', stats['errors'])
+    metric(lines, 'iss_feed_cache_coalesced_total', 'counter', 'Callers that waited on another thread\'s refresh.', stats['coalesced'])
+    #routes read the refresher's snapshot rather than the feed cache, so this only covers trips upstream
+    checks = stats['misses'] + stats['revalidations']
+    metric(lines, 'iss_feed_revalidation_ratio', 'gauge', 'Fraction of upstream checks of the OEM file answered with 304 Not Modified.', stats['revalidations']/checks if checks else 0)
+    metric(lines, 'iss_upstream_bytes_total', 'counter', 'Bytes of OEM file downloaded from upstream.', stats['bytes'])
+    metric(lines, 'iss_refresh_epochs_total', 'counter', 'Epochs in the OEM files downloaded.', stats['epochs'])
+    metric(lines, 'iss_refresh_reused_epochs_total', 'counter', 'Downloaded epochs whose speed and location were reused from the previous file.', stats['reused'])
+    metric(lines, 'iss_refresh_reuse_ratio', 'gauge', 'Fraction of the epochs in the last downloaded file whose speed and location were reused.', stats['last_reuse'] if stats['last_reuse'] is not None else 'NaN')
+    cached = response_cache.stats()
+    metric(lines, 'iss_response_cache_hits_total', 'counter', 'Responses served from the response cache.', cached['hits'])
+    metric(lines, 'iss_response_cache_misses_total', 'counter', 'Responses that had to be built.', cached['misses'])
+    metric(lines, 'iss_response_cache_evictions_total', 'counter', 'Responses evicted from the response cache to stay within its size.', cached['evictions'])
+    metric(lines, 'iss_response_cache_bytes', 'gauge', 'Total size of the cached responses.', cached['bytes'])
+    metric(lines, 'iss_refresh_failures_total', 'counter', 'Failed background refreshes.', refresher.failures)
+    #the age of the data routes are being served from
+    current = refresher.current
+    age = time.monotonic() - current[1] if BACKGROUND_REFRESH and current is not None else stats['age']
+    version = current[0].version if BACKGROUND_REFRESH and current is not None else stats['version']
+    metric(lines, 'iss_dataset_version', 'gauge', 'Version of the OEM data being served.', version)
+    metric(lines, 'iss_dataset_age_seconds', 'gauge', 'Seconds since the data being served was confirmed to match upstream.', age if age is not None else 'NaN')
+    #only report the geocoder once a request has created it
+    if get_geocoder.cache_info().currsize:
+        info = get_geocoder().lookup.cache_info()
+        metric(lines, 'iss_geocode_cache_hits_total', 'counter', 'Reverse geocoding lookups answered from the cache.', info.hits)
+        metric(lines, 'iss_geocode_cache_misses_total', 'counter', 'Reverse geocoding lookups passed to the backend.', info.misses)
+        metric(lines, 'iss_geocode_cache_hit_ratio', 'gauge', 'Fraction of reverse geocoding lookups answered from the cache.', info.hits/(info.hits + info.misses) if info.hits + info.misses else 0)
+    return Response('\n'.join(lines) + '\n', mimetype = 'text/plain; version=0.0.4')
 
 #The next statement should usually appear at the bottom of a flask app
 if __name__ == '__main__':
+    #with debug on the app is served by a child process that the reloader starts, so only that process warms up
+    if WARM_UP and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
     app.run(debug=True, host = '0.0.0.0')
 
 
@@ -1,17 +1,27 @@
 #! /usr/bin/env python3
 #import relevant python libraries
 import xmltodict
+import json
 import requests
 import math
 import logging
 import socket
+import threading
+import http.server
+import tempfile
+import time
+import iss_tracker
+import os
+import subprocess
+import sys
 import pytest
+import numpy as np
 
 from astropy import coordinates, units
 from astropy.time import Time
 from geopy.geocoders import Nominatim
 from flask import Flask, request
-from iss_tracker import time_range,currEpoch, speed, avg_speed, find_location
+from iss_tracker import time_range,currEpoch, speed, speeds, avg_speed, find_location, FeedCache, StateVectorStore, parse_oem, parse_oem_stream, parse_time, GroundTrack, seconds_to_epoch, seconds_to_epochs, GazetteerGeocoder, ReverseGeocoder, Refresher, Histogram, Snapshot, ResponseCache, OEMDataset, find_passes, shadow
 
 data = {
     "EPOCH": "2024-062T12:00:00.000Z",
@@ -97,6 +107,49 @@ data3_single = {
     }}
 data3 = [ data3_single, data3_single]
 
+#a small OEM file in the same layout as ISS.OEM_J2K_EPH.xml, served by a local stand-in for the NASA server
+oem_xml = b'''<?xml version="1.0" encoding="UTF-8"?>
+<ndm><oem id="CCSDS_OEM_VERS" version="2.0">
+<header><CREATION_DATE>2024-062T00:00:00.000Z</CREATION_DATE><ORIGINATOR>JSC</ORIGINATOR></header>
+<body><segment>
+<metadata><OBJECT_NAME>ISS</OBJECT_NAME><OBJECT_ID>1998-067-A</OBJECT_ID><CENTER_NAME>EARTH</CENTER_NAME><REF_FRAME>EME2000</REF_FRAME><TIME_SYSTEM>UTC</TIME_SYSTEM><START_TIME>2024-062T12:00:00.000Z</START_TIME><STOP_TIME>2024-062T12:12:00.000Z</STOP_TIME></metadata>
+<data><COMMENT>Units are in kg and m^2</COMMENT><COMMENT>MASS=459325.00</COMMENT><COMMENT/>
+<stateVector><EPOCH>2024-062T12:00:00.000Z</EPOCH><X units="km">6778.0</X><Y units="km">0.0</Y><Z units="km">0.0</Z><X_DOT units="km/s">0.0</X_DOT><Y_DOT units="km/s">4.7</Y_DOT><Z_DOT units="km/s">5.9</Z_DOT></stateVector>
+<stateVector><EPOCH>2024-062T12:04:00.000Z</EPOCH><X units="km">6347.3</X><Y units="km">695.8</Y><Z units="km">1378.2</Z><X_DOT units="km/s">-3.6</X_DOT><Y_DOT units="km/s">4.4</Y_DOT><Z_DOT units="km/s">5.5</Z_DOT></stateVector>
+<stateVector><EPOCH>2024-062T12:08:00.000Z</EPOCH><X units="km">5104.9</X><Y units="km">1300.6</Y><Z units="km">2576.4</Z><X_DOT units="km/s">-6.7</X_DOT><Y_DOT units="km/s">3.5</Y_DOT><Z_DOT units="km/s">4.4</Z_DOT></stateVector>
+<stateVector><EPOCH>2024-062T12:12:00.000Z</EPOCH><X units="km">3240.0</X><Y units="km">1731.5</Y><Z units="km">3430.1</Z><X_DOT units="km/s">-8.7</X_DOT><Y_DOT units="km/s">2.1</Y_DOT><Z_DOT units="km/s">2.6</Z_DOT></stateVector>
+</data></segment></body></oem></ndm>
+'''
+
+class FakeUpstream(http.server.BaseHTTPRequestHandler):
+    #stand-in for the NASA S3 bucket: serves oem_xml with an ETag and honours If-None-Match
+    body = oem_xml
+    etag = '"v1"'
+    delay = 0
+    requests_seen = []
+
+    def do_GET(self):
+        FakeUpstream.requests_seen.append(dict(self.headers))
+        time.sleep(self.delay)
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_upstream():
+    FakeUpstream.requests_seen = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/ISS.OEM_J2K_EPH.xml'
+
 #testing built-in functions:
 def test_time_range():
     assert(isinstance(time_range(data1), str) == True)
@@ -132,6 +185,357 @@ def test_find_location():
     assert(float(results[1]) >=-180 and float(results[1]) <=180) #check for valid longitude
     assert(abs(float(results[2])) >= 0) #check for valid altitude
 
+def test_state_vector_store():
+    raw = xmltodict.parse(oem_xml)['ndm']['oem']['body']['segment']['data']['stateVector']
+    store = parse_oem(oem_xml).vectors
+    assert(len(store) == 4)
+    assert(store.positions.shape == (4, 3) and store.velocities.shape == (4, 3))
+    assert(store.seconds[1] - store.seconds[0] == 240.0)
+    #rows are rebuilt in the same layout xmltodict produces, so the /epochs output does not change
+    assert([store[i] for i in range(4)] == raw)
+    assert(store[-1] == raw[-1])
+    assert(abs(speeds(store)[1] - speed(raw[1])) < 1e-12)
+    assert(abs(avg_speed(store) - avg_speed(raw)) < 1e-12)
+    with pytest.raises(ValueError):
+        StateVectorStore.from_state_vectors(data3)
+
+def test_parse_oem_stream():
+    expected = parse_oem(oem_xml)
+    #feed the parser small chunks that split elements, as response.iter_content() would
+    result = parse_oem_stream(oem_xml[i:i+37] for i in range(0, len(oem_xml), 37))
+    assert(result.header == expected.header)
+    assert(result.metadata == expected.metadata)
+    assert(result.comments == expected.comments)
+    assert(list(result.vectors) == list(expected.vectors))
+    assert((result.vectors.positions == expected.vectors.positions).all())
+    assert(parse_oem_stream(oem_xml).vectors.units == expected.vectors.units)
+
+def test_epoch_index():
+    index = parse_oem(oem_xml).index
+    assert(index.find('2024-062T12:04:00.000Z') == 1)
+    #day 62 of 2024 is March 2nd
+    assert(index.find('2024-03-02T12:04:00Z') == 1)
+    assert(index.find('2024-03-02T12:04:00') == 1)
+    assert(index.find('2024-03-02T12:05:30Z') is None)
+    assert(index.find('2024-03-02T12:05:30Z', 'nearest') == 1)
+    assert(index.find('2024-062T12:06:30.000Z', 'nearest') == 2)
+    assert(index.find('2024-03-03T00:00:00Z', 'nearest') is None) #outside the data's time span
+    assert(list(index.range(parse_time('2024-062T12:02:00.000Z'), parse_time('2024-062T12:08:00.000Z'))) == [1, 2])
+    assert(len(index.range(parse_time('2024-062T13:00:00.000Z'))) == 0)
+    #thinning out the epochs for plotting
+    lo, hi = index.window(parse_time('2024-062T12:02:00.000Z'))
+    assert((lo, hi) == (1, 4))
+    assert(list(index.sample(0, 4, step=480)) == [0, 2])
+    assert(list(index.sample(0, 4, step=300)) == [0, 2, 3])
+    assert(list(index.sample(0, 4, max_points=2)) == [0, 3])
+    assert(list(index.sample(lo, hi, step=60, max_points=2)) == [1, 3])
+    assert(len(index.sample(2, 2, step=60)) == 0)
+    with pytest.raises(ValueError):
+        index.find('2024-062T12:04:00.000Z', 'closest')
+    with pytest.raises(ValueError):
+        index.find('yesterday')
+
+def test_ground_track():
+    dataset = parse_oem(oem_xml)
+    track = dataset.ground_track
+    assert(isinstance(track, GroundTrack) and len(track) == 4)
+    assert(dataset.ground_track is track) #computed once per dataset
+    #the vectorized transform agrees with find_location on every epoch
+    for i in range(4):
+        single = find_location(dataset.vectors[i])
+        assert(all(abs(float(a) - b) < 1e-6 for a, b in zip(single, track[i])))
+
+def test_hermite_interpolator():
+    dataset = parse_oem(oem_xml)
+    vectors = dataset.vectors
+    positions, velocities = dataset.interpolator(vectors.seconds)
+    #the interpolation passes through every sample
+    assert(abs(positions - vectors.positions).max() < 1e-6)
+    assert(abs(velocities - vectors.velocities).max() < 1e-6)
+    #between samples it stays between the neighbouring positions
+    positions, velocities = dataset.interpolator(parse_time('2024-062T12:06:00.000Z'))
+    assert(positions.shape == (1, 3) and velocities.shape == (1, 3))
+    assert(vectors.positions[2][0] < positions[0][0] < vectors.positions[1][0])
+    with pytest.raises(ValueError):
+        dataset.interpolator(parse_time('2024-062T13:00:00.000Z'))
+    assert(seconds_to_epoch(parse_time('2024-062T12:06:00.250Z')) == '2024-062T12:06:00.250Z')
+    #many at once, with gaps, matching the one at a time conversion (including the last day of a leap year)
+    times = [parse_time('2024-062T12:06:00.250Z'), None, parse_time('2024-366T23:59:59.9996Z'), float('nan')]
+    assert(seconds_to_epochs(times) == ['2024-062T12:06:00.250Z', None, seconds_to_epoch(times[2]), None])
+
+def circular_orbit(hours = 6, step = 240):
+    #a dataset with the ISS on a circular 51.6 degree orbit, sampled every four minutes like the published file
+    radius, inclination = 6795.0, math.radians(51.6)
+    rate = math.sqrt(398600.4418/radius)/radius
+    state_vectors = []
+    for i in range(hours*3600//step + 1):
+        angle = rate*i*step
+        values = (radius*math.cos(angle), radius*math.sin(angle)*math.cos(inclination), radius*math.sin(angle)*math.sin(inclination),
+                  -rate*radius*math.sin(angle), rate*radius*math.cos(angle)*math.cos(inclination), rate*radius*math.cos(angle)*math.sin(inclination))
+        item = {'EPOCH': seconds_to_epoch(parse_time('2024-062T00:00:00.000Z') + i*step)}
+        for key, value in zip(('X', 'Y', 'Z', 'X_DOT', 'Y_DOT', 'Z_DOT'), values):
+            item[key] = {'#text': f'{value:.9f}', '@units': 'km' if len(key) == 1 else 'km/s'}
+        state_vectors.append(item)
+    return OEMDataset({}, {}, [], StateVectorStore.from_state_vectors(state_vectors))
+
+def test_find_passes():
+    dataset = circular_orbit()
+    track = dataset.ground_track
+    #an observer right under the ISS at one epoch sees it almost straight overhead then, an observer at the pole never sees it
+    row = 40
+    found = find_passes(dataset, [[track.lat[row], track.lon[row]], [90., 0.]])
+    assert(len(found) == 2 and found[1] == [])
+    rise, culmination, fall, highest = min(found[0], key=lambda item: abs(item[1] - dataset.vectors.seconds[row]))
+    assert(abs(culmination - dataset.vectors.seconds[row]) < 5 and highest > 89)
+    assert(rise < culmination < fall and 60 < fall - rise < 900)
+    #the elevation at rise and set is the minimum elevation, checked against the astropy transform
+    for when, expected in ((rise, 10.), (fall, 10.), (culmination, highest)):
+        positions, _ = dataset.interpolator(when)
+        lat, lon, alt = (float(value[0]) for value in iss_tracker.geodetic(positions, [when]))
+        iss = coordinates.EarthLocation.from_geodetic(lon*units.deg, lat*units.deg, alt*units.km).itrs.cartesian.xyz.to(units.km).value
+        here = coordinates.EarthLocation.from_geodetic(track.lon[row]*units.deg, track.lat[row]*units.deg, 0*units.km)
+        offset = iss - here.itrs.cartesian.xyz.to(units.km).value
+        up = [math.cos(math.radians(track.lat[row]))*math.cos(math.radians(track.lon[row])), math.cos(math.radians(track.lat[row]))*math.sin(math.radians(track.lon[row])), math.sin(math.radians(track.lat[row]))]
+        elevation = math.degrees(math.asin(sum(a*b for a, b in zip(offset, up))/math.sqrt(sum(a*a for a in offset))))
+        assert(abs(elevation - expected) < 0.05)
+    #every pass above 10 degrees lies within a longer pass above 0 degrees
+    lower = find_passes(dataset, [track.lat[row], track.lon[row]], 0.)[0]
+    assert(len(lower) >= len(found[0]))
+    assert(all(any(a[0] is not None and b[0] is not None and a[0] < b[0] and abs(a[1] - b[1]) < 1 for a in lower) for b in found[0] if b[0] is not None))
+    with pytest.raises(ValueError):
+        find_passes(dataset, [[100., 0.]])
+    with pytest.raises(ValueError):
+        find_passes(dataset, [[0., 0.]], 90.)
+    for observer in ([math.nan, 0.], [0., math.inf], [0., 0., math.nan]):
+        with pytest.raises(ValueError):
+            find_passes(dataset, [observer])
+
+def test_illumination():
+    #straight behind the Earth is in the umbra, just beside its shadow in the penumbra, and towards the Sun in sunlight
+    sun = np.array([[1.496e8, 0., 0.]]*3)
+    penumbra, umbra = shadow(np.array([[-6800., 0., 0.], [-6800., 6380., 0.], [6800., 0., 0.]]), sun)
+    assert(umbra[0] < 0 and penumbra[1] < 0 < umbra[1] and penumbra[2] > 0)
+
+    dataset = circular_orbit()
+    illumination = dataset.illumination
+    assert(dataset.illumination is illumination) #computed once per dataset
+    assert(set(illumination.state) <= {0, 1, 2} and 2 in illumination.state)
+    #the orbit plane does not move, so the beta angle follows the Sun against its fixed normal
+    sun = iss_tracker.sun_positions(dataset.vectors.seconds)
+    normal = np.array([0., -math.sin(math.radians(51.6)), math.cos(math.radians(51.6))])
+    assert(abs(illumination.beta - np.degrees(np.arcsin(sun @ normal / np.linalg.norm(sun, axis=1)))).max() < 1e-6)
+    whole = [eclipse for eclipse in illumination.eclipses if None not in eclipse]
+    assert(len(whole) >= 2)
+    for entry, umbra_entry, umbra_exit, leave in whole:
+        #the penumbra takes seconds to cross and the shadow about half an hour
+        assert(entry < umbra_entry < umbra_exit < leave)
+        assert(umbra_entry - entry < 30 and leave - umbra_exit < 30 and 1200 < leave - entry < 2400)
+        #the times are where the ISS crosses the edges of the shadow
+        positions, _ = dataset.interpolator([entry, umbra_entry])
+        edges = shadow(positions, iss_tracker.sun_positions(np.array([entry, umbra_entry])))
+        assert(abs(edges[0][0]) < 1e-6 and abs(edges[1][1]) < 1e-6)
+    #the state at every epoch agrees with the eclipse times
+    seconds = dataset.vectors.seconds
+    umbra = np.zeros(len(seconds), dtype=bool)
+    for entry, umbra_entry, umbra_exit, leave in illumination.eclipses:
+        umbra |= (seconds >= (umbra_entry or -np.inf)) & (seconds <= (umbra_exit or np.inf)) & (umbra_entry is not None or umbra_exit is not None)
+    assert(((illumination.state == 2) == umbra).all())
+    assert(illumination[0][0] in ('sunlit', 'penumbra', 'umbra'))
+
+def test_gazetteer_geocoder():
+    geocoder = GazetteerGeocoder()
+    assert('New York' in geocoder.reverse(40.7, -74.0).address)
+    assert(geocoder.reverse(0.0, -30.0) is None) #middle of the Atlantic
+    assert(geocoder.reverse(-45.0, -120.0) is None) #southern Pacific
+    assert(geocoder.reverse(40.0, -71.0) is None) #off Long Island, inside the New York place's radius but out at sea
+    #inland points far from every place are named after their country
+    for lat, lon, country in ((31, -102, 'United States of America'), (23, 10, 'Algeria'), (0, 22, 'Dem. Rep. Congo'), (62, 100, 'Russia'), (72, -40, 'Greenland'), (62, -100, 'Canada')):
+        place = geocoder.reverse(lat, lon)
+        assert(place.address == country and (place.latitude, place.longitude) == (lat, lon))
+    #a place's radius stops at the border: south-west of El Paso is Mexico, south of Winnipeg is the United States, and across the river from Brazzaville is Kinshasa
+    assert(geocoder.reverse(31, -107).address.endswith('Mexico'))
+    assert(geocoder.reverse(48.5, -95).address == 'United States of America')
+    assert(geocoder.reverse(-4.3, 15.3).address.startswith('Kinshasa'))
+    #holes in a country are left out of it
+    assert(geocoder.countries.country(-29.5, 28.2) == 'Lesotho' and geocoder.countries.country(-29.0, 25.0) == 'South Africa')
+    #a GeoNames dump can be used in place of the bundled gazetteer
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'cities15000.txt')
+        with open(path, 'w') as f:
+            f.write('\t'.join(['4671654', 'Austin', 'Austin', '', '30.26715', '-97.74306', 'P', 'PPLA', 'US', '', 'TX'] + ['']*8) + '\n')
+        place = GazetteerGeocoder(path).reverse(30.3, -97.7)
+        assert(place.address == 'Austin, TX, US')
+        #GeoNames country codes are matched against the countries the same way
+        wide = GazetteerGeocoder(path, default_radius=500)
+        assert(wide.reverse(29.0, -99.0).address == 'Austin, TX, US' and wide.reverse(28.0, -100.5).address == 'Mexico')
+
+class CountingBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def reverse(self, lat, lon):
+        self.calls += 1
+        return None
+
+def test_reverse_geocoder_cache():
+    backend = CountingBackend()
+    geocoder = ReverseGeocoder(backend, precision=0.01)
+    assert(geocoder.reverse(10.001, 20.001) is None)
+    assert(geocoder.reverse(10.002, 20.002) is None) #rounds to the same cache entry
+    assert(backend.calls == 1)
+    assert(geocoder.reverse_many([(1.0, 1.0), (1.001, 1.001), (2.0, 2.0)]) == [None, None, None])
+    assert(backend.calls == 3)
+
+def test_feed_cache():
+    server, url = start_fake_upstream()
+    try:
+        cache = FeedCache(url, ttl=60)
+        first = cache.get()
+        assert(len(first.vectors) == 4)
+        assert(cache.get() is first) #served from the cache without contacting upstream
+        assert(len(FakeUpstream.requests_seen) == 1)
+        assert(cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1)
+
+        #once the TTL has passed the cache revalidates and upstream answers 304
+        cache.ttl = 0
+        assert(cache.get() is first)
+        assert(FakeUpstream.requests_seen[-1].get('If-None-Match') == '"v1"')
+        assert(cache.stats()['revalidations'] == 1 and cache.stats()['version'] == 1)
+
+        #a changed upstream file is downloaded and parsed again
+        FakeUpstream.etag = '"v2"'
+        assert(cache.get() is not first)
+        assert(cache.stats()['misses'] == 2 and cache.stats()['version'] == 2)
+
+        #if upstream goes down the last copy is still served
+        latest = cache.get()
+        server.shutdown()
+        server.server_close()
+        assert(cache.get() is latest)
+        assert(cache.stats()['errors'] == 1)
+    finally:
+        FakeUpstream.etag = '"v1"'
+        server.shutdown()
+
+def test_incremental_refresh():
+    server, url = start_fake_upstream()
+    try:
+        cache = FeedCache(url, ttl=0)
+        first = cache.get().prepare()
+        #the next file drops the first epoch, revises the third and adds one at the end
+        vectors = oem_xml.split(b'<stateVector>')
+        FakeUpstream.body = b'<stateVector>'.join([vectors[0]] + vectors[2:3] + [vectors[3].replace(b'5104.9', b'5104.8')] + vectors[4:]).replace(b'</data>',
+            b'<stateVector><EPOCH>2024-062T12:16:00.000Z</EPOCH><X units="km">1000.0</X><Y units="km">1900.0</Y><Z units="km">3900.0</Z><X_DOT units="km/s">-9.5</X_DOT><Y_DOT units="km/s">0.5</Y_DOT><Z_DOT units="km/s">0.8</Z_DOT></stateVector>\n</data>')
+        FakeUpstream.etag = '"v2"'
+        second = cache.get()
+        assert(list(second.vectors.match(first.vectors)[1]) == [1, 3])
+        assert(cache.stats()['reused'] == 2 and cache.stats()['epochs'] == 8 and cache.stats()['last_reuse'] == 0.5)
+        #the unchanged epochs took over the previous results, and every epoch agrees with computing them from scratch
+        assert('ground_track' in vars(second) and 'speeds' in vars(second))
+        assert(second.ground_track[0] == first.ground_track[1] and second.ground_track[2] == first.ground_track[3])
+        fresh = parse_oem(FakeUpstream.body)
+        assert(abs(second.speeds - fresh.speeds).max() < 1e-12)
+        assert(abs(second.sun - fresh.sun).max() < 1e-6)
+        for i in range(4):
+            assert(all(abs(a - b) < 1e-9 for a, b in zip(second.ground_track[i], fresh.ground_track[i])))
+    finally:
+        FakeUpstream.body = oem_xml
+        FakeUpstream.etag = '"v1"'
+        server.shutdown()
+
+def test_refresher():
+    server, url = start_fake_upstream()
+    refresher = Refresher(FeedCache(url, ttl=60), interval=0.05)
+    try:
+        first, age = refresher.get()
+        #the derived data was built before the snapshot was published
+        assert('ground_track' in vars(first) and 'index' in vars(first) and 'speeds' in vars(first))
+        assert(age < 1)
+        #the background thread revalidates on schedule, and an unchanged file keeps the same snapshot
+        refresher.start()
+        #once the thread runs, starting it again (as every request does) does not wait on the refresher's lock
+        thread = refresher.thread
+        with refresher.lock:
+            starter = threading.Thread(target=refresher.start)
+            starter.start()
+            starter.join(1)
+            assert(not starter.is_alive())
+        assert(refresher.thread is thread)
+        time.sleep(0.3)
+        assert(len(FakeUpstream.requests_seen) > 1)
+        assert(refresher.get()[0] is first)
+        #with upstream down the last snapshot is still served, only older
+        server.shutdown()
+        server.server_close()
+        failures = refresher.failures
+        time.sleep(0.3)
+        assert(refresher.failures > failures)
+        dataset, age = refresher.get()
+        assert(dataset is first and age > 0.2)
+    finally:
+        refresher.stop()
+
+def test_snapshot():
+    dataset = parse_oem(oem_xml)
+    dataset.version = 3
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'iss.snapshot')
+        Snapshot(path).write(dataset, etag='"v1"')
+        loaded, description = Snapshot(path).open()
+        assert(loaded.version == 3 and description['etag'] == '"v1"')
+        assert(loaded.header == dataset.header and loaded.metadata == dataset.metadata and loaded.comments == dataset.comments)
+        assert(list(loaded.vectors) == list(dataset.vectors))
+        #the arrays are read-only views of the file, and the derived data comes with them
+        assert(not loaded.vectors.positions.flags.writeable)
+        assert(abs(loaded.ground_track.lat - dataset.ground_track.lat).max() == 0)
+        t = parse_time('2024-062T12:06:00.000Z')
+        assert(abs(loaded.interpolator(t)[0] - dataset.interpolator(t)[0]).max() == 0)
+
+        #the Sun and the illumination are stored too, so a process reading the snapshot does not compute them again
+        orbit = circular_orbit(hours = 4)
+        Snapshot(path).write(orbit)
+        loaded, description = Snapshot(path).open()
+        original = iss_tracker.sun_positions
+        iss_tracker.sun_positions = None
+        try:
+            loaded.prepare()
+        finally:
+            iss_tracker.sun_positions = original
+        assert(abs(loaded.sun - orbit.sun).max() == 0)
+        assert(list(loaded.illumination.state) == list(orbit.illumination.state) and abs(loaded.illumination.beta - orbit.illumination.beta).max() == 0)
+        assert(loaded.illumination.eclipses == orbit.illumination.eclipses and orbit.illumination.eclipses[-1][3] is None)
+
+def test_snapshot_refresher():
+    #one process refreshes and writes the snapshot, the others only read it
+    server, url = start_fake_upstream()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'iss.snapshot')
+        leader = Refresher(FeedCache(url, ttl=60), interval=60, snapshot=Snapshot(path))
+        follower = Refresher(FeedCache(url, ttl=60), interval=60, snapshot=Snapshot(path))
+        try:
+            first, age = leader.get()
+            dataset, age = follower.get()
+            assert(len(FakeUpstream.requests_seen) == 1)
+            assert(list(dataset.vectors) == list(first.vectors) and dataset.version == first.version == 1)
+            #a new version written by the leader is picked up by the follower
+            FakeUpstream.etag = '"v2"'
+            leader.poll()
+            assert(follower.poll(60).version == 2)
+            assert(len(FakeUpstream.requests_seen) == 2)
+            #a restarted process serves the last snapshot without contacting upstream
+            leader.snapshot.release()
+            server.shutdown()
+            server.server_close()
+            restarted = Refresher(FeedCache(url, ttl=60), interval=60, snapshot=Snapshot(path))
+            dataset, age = restarted.get()
+            assert(dataset.version == 2 and age < 60)
+            restarted.snapshot.release()
+        finally:
+            FakeUpstream.etag = '"v1"'
+            leader.snapshot.release()
+            follower.snapshot.release()
+            server.shutdown()
+
 #testing routes:
 response1 = requests.get('http://127.0.0.1:5000/epochs')
 a_rep_epoch = str(response1.json()[0]['EPOCH'])
@@ -143,9 +547,72 @@ epoch_q1 = requests.get('http://127.0.0.1:5000/epochs?limit=1')
 epoch_q2 = requests.get('http://127.0.0.1:5000/epochs?offset=1')
 a_rep_epoch2 = str(response1.json()[1]['EPOCH'])
 epoch_q3 = requests.get('http://127.0.0.1:5000/epochs?limit=1&offset=1')
+resp_nearest = requests.get('http://127.0.0.1:5000/epochs/'+a_rep_epoch+'?match=nearest')
 resp6 = requests.get('http://127.0.0.1:5000/epochs/'+a_rep_epoch+'/speed')
 resp7 = requests.get('http://127.0.0.1:5000/epochs/'+a_rep_epoch+'/location')
 resp8 = requests.get('http://127.0.0.1:5000/now')
+resp_at = requests.get('http://127.0.0.1:5000/at?t='+a_rep_epoch)
+resp_at2 = requests.get('http://127.0.0.1:5000/at?t='+a_rep_epoch+'&t='+a_rep_epoch2)
+resp_page = requests.get('http://127.0.0.1:5000/epochs?limit=1')
+resp_page2 = requests.get('http://127.0.0.1:5000/epochs?limit=1&cursor='+resp_page.headers['X-Next-Cursor'])
+resp_offset_page = requests.get('http://127.0.0.1:5000/epochs?offset=5&limit=3')
+resp_offset_page2 = requests.get('http://127.0.0.1:5000/epochs?offset=5&limit=3&cursor='+resp_offset_page.headers['X-Next-Cursor'])
+resp_ndjson = requests.get('http://127.0.0.1:5000/epochs?limit=3&offset=1', headers={'Accept': 'application/x-ndjson'})
+resp_track = requests.get('http://127.0.0.1:5000/groundtrack?start='+a_rep_epoch+'&end='+a_rep_epoch2)
+resp_profile = requests.get('http://127.0.0.1:5000/epochs/'+a_rep_epoch+'/location', headers={'X-Profile': '1'})
+resp_metrics = requests.get('http://127.0.0.1:5000/metrics')
+resp_passes = requests.get('http://127.0.0.1:5000/passes?observer=30,-95&observer=90,0,0.1&min_elevation=5')
+resp_passes_post = requests.post('http://127.0.0.1:5000/passes', json={'observers': [[30, -95]], 'min_elevation': 5})
+resp_passes_bad = requests.get('http://127.0.0.1:5000/passes?observer=north')
+resp_passes_nan = requests.get('http://127.0.0.1:5000/passes?observer=nan,0')
+resp_passes_inf = requests.post('http://127.0.0.1:5000/passes', json={'observers': ['0,inf']})
+resp_window = requests.get('http://127.0.0.1:5000/epochs?start='+a_rep_epoch2+'&end='+a_rep_epoch2)
+resp_step = requests.get('http://127.0.0.1:5000/epochs?step=1800&limit=3')
+resp_max_points = requests.get('http://127.0.0.1:5000/epochs?max_points=5')
+resp_bad_step = requests.get('http://127.0.0.1:5000/epochs?step=-1')
+resp_flat = requests.get('http://127.0.0.1:5000/epochs?limit=3', headers={'Accept': 'application/vnd.iss.flat+json'})
+resp_msgpack = requests.get('http://127.0.0.1:5000/epochs?limit=3', headers={'Accept': 'application/msgpack'})
+resp_columns = requests.get('http://127.0.0.1:5000/epochs?limit=3', headers={'Accept': 'application/octet-stream'})
+resp_track_columns = requests.get('http://127.0.0.1:5000/groundtrack?start='+a_rep_epoch+'&end='+a_rep_epoch2, headers={'Accept': 'application/octet-stream'})
+resp_illumination = requests.get('http://127.0.0.1:5000/epochs/'+a_rep_epoch+'/illumination')
+resp_eclipses = requests.get('http://127.0.0.1:5000/eclipses')
+resp_eclipses_window = requests.get('http://127.0.0.1:5000/eclipses?start='+a_rep_epoch+'&end='+a_rep_epoch)
+resp_bad_cursor = requests.get('http://127.0.0.1:5000/epochs?cursor=%25%25%25')
+resp_bad_cursor2 = requests.get('http://127.0.0.1:5000/epochs?cursor=aGVsbG8')
+resp_not_modified = requests.get('http://127.0.0.1:5000/header', headers={'If-None-Match': resp4.headers['ETag']})
+
+def test_concurrent_requests_single_fetch():
+    #a burst of requests against a cold cache should cause exactly one upstream download, with every other request waiting on it
+    #through the feed cache's single-flight group (the background refresher is turned off, so requests reach the feed cache)
+    server, url = start_fake_upstream()
+    FakeUpstream.delay = 0.5
+    original = iss_tracker.feed_cache, iss_tracker.BACKGROUND_REFRESH
+    iss_tracker.feed_cache = FeedCache(url, ttl=60)
+    iss_tracker.BACKGROUND_REFRESH = False
+    try:
+        n = 16
+        barrier = threading.Barrier(n)
+        statuses = []
+        def hit(path):
+            client = iss_tracker.app.test_client()
+            barrier.wait()
+            response = client.get(path)
+            statuses.append(response.status_code)
+            assert(response.headers['X-Dataset-Version'] == '1')
+        threads = [threading.Thread(target=hit, args=(['/header', '/metadata', '/comment', '/epochs'][i % 4],)) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(statuses == [200]*n)
+        assert(len(FakeUpstream.requests_seen) == 1)
+        assert(iss_tracker.feed_cache.stats()['misses'] == 1)
+        assert(iss_tracker.feed_cache.stats()['coalesced'] == n - 1)
+    finally:
+        iss_tracker.feed_cache, iss_tracker.BACKGROUND_REFRESH = original
+        iss_tracker.response_cache.clear()
+        FakeUpstream.delay = 0
+        server.shutdown()
 
 def test_epochs_route():
     assert response1.status_code == 200
@@ -155,12 +622,17 @@ def test_specific_epochs_route():
     assert response2.status_code == 200
     assert isinstance(response2.json(), dict) == True
 
+def test_specific_epochs_nearest_route():
+    assert resp_nearest.status_code == 200
+    assert resp_nearest.json()['EPOCH'] == a_rep_epoch
+
 def test_comment_route():
     assert resp3.status_code == 200
     assert isinstance(resp3.json(), list) == True
 
 def test_header_route():
     assert resp4.status_code == 200
+    assert int(resp4.headers['X-Dataset-Age']) >= 0
     assert isinstance(resp4.json(), dict) == True
 
 def test_metadata_route():
@@ -177,9 +649,58 @@ def test_epoch_query_route():
     assert isinstance(epoch_q3.json(), list) == True
     assert (str(epoch_q3.json()[0]['EPOCH']) == a_rep_epoch2)
 
+def test_epoch_cursor_route():
+    assert resp_page.status_code == 200 and resp_page2.status_code == 200
+    assert [item['EPOCH'] for item in resp_page2.json()] == [a_rep_epoch2]
+    assert resp_page2.headers['X-Next-Cursor'] != resp_page.headers['X-Next-Cursor']
+    #repeating the first page's query with the cursor added continues right after that page, without skipping the offset again
+    assert [item['EPOCH'] for item in resp_offset_page.json() + resp_offset_page2.json()] == [item['EPOCH'] for item in response1.json()[5:11]]
+    assert requests.get('http://127.0.0.1:5000/epochs?offset=5&limit=3&cursor='+resp_offset_page2.headers['X-Next-Cursor']).json()[0]['EPOCH'] == response1.json()[11]['EPOCH']
+    #characters outside the base64 alphabet, and cursors that do not hold an epoch, are both rejected as bad cursors
+    assert resp_bad_cursor.text.startswith('Invalid cursor parameter')
+    assert resp_bad_cursor2.text.startswith('Invalid cursor parameter')
+
+def test_epoch_window_route():
+    assert [item['EPOCH'] for item in resp_window.json()] == [a_rep_epoch2]
+    steps = [parse_time(item['EPOCH']) for item in resp_step.json()]
+    #one epoch from each 30 minutes, the first at or after each half hour from the start
+    assert [(t - steps[0]) // 1800 for t in steps] == [0, 1, 2]
+    assert 'X-Next-Cursor' in resp_step.headers
+    points = resp_max_points.json()
+    assert len(points) == 5 and points[0] == response1.json()[0] and points[-1] == response1.json()[-1]
+    assert resp_bad_step.text.startswith('Invalid step parameter')
+
+def test_epoch_ndjson_route():
+    assert resp_ndjson.status_code == 200
+    assert resp_ndjson.headers['Content-Type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in resp_ndjson.text.splitlines()]
+    assert len(rows) == 3
+    assert rows == response1.json()[1:4]
+
+def test_epoch_bulk_formats():
+    expected = response1.json()[:3]
+    flat = resp_flat.json()
+    assert resp_flat.headers['Content-Type'] == 'application/vnd.iss.flat+json'
+    assert [item['EPOCH'] for item in flat] == [item['EPOCH'] for item in expected]
+    assert all(row[key] == float(item[key]['#text']) for row, item in zip(flat, expected) for key in ('X', 'Y', 'Z', 'X_DOT', 'Y_DOT', 'Z_DOT'))
+    #the raw columns are the epoch seconds followed by each component, as little-endian float64
+    assert resp_columns.headers['X-Columns'] == 'EPOCH,X,Y,Z,X_DOT,Y_DOT,Z_DOT' and resp_columns.headers['X-Rows'] == '3'
+    columns = np.frombuffer(resp_columns.content, dtype='<f8').reshape(7, 3)
+    assert list(columns[0]) == [parse_time(item['EPOCH']) for item in expected]
+    assert list(columns[4]) == [row['X_DOT'] for row in flat]
+    assert len(resp_columns.content) < len(resp_flat.content) < len(response1.content)
+    track = np.frombuffer(resp_track_columns.content, dtype='<f8').reshape(4, -1)
+    assert resp_track_columns.headers['X-Columns'] == 'EPOCH,latitude,longitude,altitude'
+    assert list(track[1]) == [item['latitude'] for item in resp_track.json()]
+    msgpack = pytest.importorskip('msgpack')
+    assert resp_msgpack.headers['Content-Type'] == 'application/msgpack'
+    assert all(resp.headers['Vary'] == 'Accept' for resp in (response1, resp_flat, resp_columns, resp_track, resp_track_columns))
+    assert msgpack.unpackb(resp_msgpack.content) == flat
+
 def test_epoch_speed_route():
     assert resp6.status_code == 200
     assert isinstance(resp6.text, str) == True
+    assert resp6.text == f'Speed of about ~ {int(speed(response1.json()[0]))} km/s\n'
 
 def test_epoch_location_route():
     assert resp7.status_code == 200
@@ -189,21 +710,177 @@ def test_now_route():
     assert resp8.status_code == 200
     assert isinstance(resp8.text, str) == True
 
+def test_at_route():
+    assert resp_at.status_code == 200
+    assert resp_at.json()['EPOCH'] == a_rep_epoch
+    assert abs(float(resp_at.json()['X']['#text']) - float(response1.json()[0]['X']['#text'])) < 1e-6
+    assert [item['EPOCH'] for item in resp_at2.json()] == [a_rep_epoch, a_rep_epoch2]
+
+def test_groundtrack_route():
+    assert resp_track.status_code == 200
+    assert [item['EPOCH'] for item in resp_track.json()] == [a_rep_epoch, a_rep_epoch2]
+    assert all(-90 <= item['latitude'] <= 90 and -180 <= item['longitude'] <= 180 for item in resp_track.json())
+
+def test_illumination_route():
+    assert resp_illumination.status_code == 200
+    item = resp_illumination.json()
+    assert item['EPOCH'] == a_rep_epoch and item['state'] in ('sunlit', 'penumbra', 'umbra') and -90 <= item['beta_angle'] <= 90
+
+def test_eclipses_route():
+    assert resp_eclipses.status_code == 200
+    found = resp_eclipses.json()
+    assert len(found) > 100 #about 16 a day over 15 days
+    for item in found:
+        assert set(item) == {'entry', 'umbra_entry', 'umbra_exit', 'exit', 'duration'}
+        assert item['duration'] is None or 0 < item['duration'] < 3600
+    #at most the eclipse under way at the first epoch
+    assert len(resp_eclipses_window.json()) <= 1
+
+def test_passes_route():
+    assert resp_passes.status_code == 200
+    observers = resp_passes.json()
+    assert [(item['latitude'], item['longitude'], item['altitude']) for item in observers] == [(30, -95, 0), (90, 0, 0.1)]
+    assert observers[1]['passes'] == []
+    for item in observers[0]['passes']:
+        assert item['max_elevation'] >= 5
+        assert (item['rise'] or '') <= item['culmination'] <= (item['set'] or item['culmination'])
+    assert resp_passes_post.json()[0]['passes'] == observers[0]['passes']
+    assert resp_passes_bad.text.startswith('Invalid observer')
+    assert resp_passes_nan.text.startswith('Invalid observer') and resp_passes_inf.text.startswith('Invalid observer')
+
+def test_profile_header():
+    assert resp_profile.status_code == 200
+    stages = dict(item.split(';dur=') for item in resp_profile.headers['Server-Timing'].split(', '))
+    assert 'geocode' in stages and 'total' in stages
+    assert float(stages['geocode']) <= float(stages['total'])
+    assert 'Server-Timing' not in resp7.headers
+
+def test_metrics_route():
+    assert resp_metrics.status_code == 200
+    assert resp_metrics.headers['Content-Type'].startswith('text/plain')
+    assert 'iss_request_duration_seconds_count{route="/epochs/<epoch>/location"}' in resp_metrics.text
+    assert 'iss_stage_duration_seconds_count{route="/epochs/<epoch>/location",stage="geocode"}' in resp_metrics.text
+    values = dict(line.rsplit(' ', 1) for line in resp_metrics.text.splitlines() if not line.startswith('#'))
+    assert float(values['iss_upstream_bytes_total']) > 0
+    assert 0 <= float(values['iss_refresh_reused_epochs_total']) <= float(values['iss_refresh_epochs_total'])
+    assert 0 <= float(values['iss_feed_revalidation_ratio']) <= 1
+    assert float(values['iss_dataset_age_seconds']) >= 0
+
+def test_lazy_imports():
+    #importing the app does not load astropy, geopy or xmltodict, warming up loads astropy
+    code = "import sys, iss_tracker; print([m for m in ('astropy', 'geopy', 'xmltodict') if m in sys.modules]); iss_tracker.warm_up(fetch=False); print('astropy' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert(output.stdout.splitlines() == ['[]', 'True'])
+
+def test_response_cache():
+    cache = ResponseCache(max_bytes=10)
+    cache.put((1, 'a'), (b'1234', [], 'x'))
+    cache.put((1, 'b'), (b'1234', [], 'y'))
+    assert(cache.get((1, 'a')) == (b'1234', [], 'x'))
+    cache.put((1, 'c'), (b'1234', [], 'z')) #evicts b, the least recently used
+    assert(cache.get((1, 'b')) is None and cache.get((1, 'a')) is not None)
+    assert(cache.stats()['evictions'] == 1 and cache.stats()['bytes'] == 8)
+    cache.put((1, 'd'), (b'12345678901', [], 'w')) #larger than the whole cache
+    assert(cache.get((1, 'd')) is None)
+    #a newer dataset version makes every older entry stale
+    cache.put((2, 'a'), (b'1', [], 'v'))
+    assert(cache.get((1, 'a')) is None and cache.stats()['entries'] == 1)
+
+def test_cached_routes():
+    server, url = start_fake_upstream()
+    original = iss_tracker.feed_cache, iss_tracker.refresher
+    iss_tracker.feed_cache = FeedCache(url, ttl=60)
+    iss_tracker.refresher = Refresher(iss_tracker.feed_cache, interval=60)
+    iss_tracker.response_cache.clear()
+    try:
+        client = iss_tracker.app.test_client()
+        first = client.get('/epochs?limit=2')
+        second = client.get('/epochs?limit=2')
+        assert(first.data == second.data and first.headers['X-Next-Cursor'] == second.headers['X-Next-Cursor'])
+        assert(iss_tracker.response_cache.stats()['hits'] == 1)
+        #the format depends on the Accept header, which shared caches are told, also for responses from the cache
+        assert(first.headers['Vary'] == second.headers['Vary'] == 'Accept')
+        etag = first.headers['ETag']
+        assert(etag.startswith('"1-'))
+        not_modified = client.get('/epochs?limit=2', headers={'If-None-Match': etag})
+        assert(not_modified.status_code == 304 and not_modified.data == b'')
+        #other arguments are a different resource, and NDJSON is streamed rather than cached
+        assert(client.get('/epochs?limit=3').headers['ETag'] != etag)
+        assert('ETag' not in client.get('/epochs', headers={'Accept': 'application/x-ndjson'}).headers)
+        #once upstream changes the old ETag no longer matches
+        FakeUpstream.etag = '"v2"'
+        iss_tracker.refresher.poll()
+        changed = client.get('/epochs?limit=2', headers={'If-None-Match': etag})
+        assert(changed.status_code == 200 and changed.headers['ETag'].startswith('"2-'))
+    finally:
+        FakeUpstream.etag = '"v1"'
+        iss_tracker.refresher.stop()
+        iss_tracker.feed_cache, iss_tracker.refresher = original
+        iss_tracker.response_cache.clear()
+        server.shutdown()
+
+def test_not_modified_route():
+    assert 'ETag' in resp4.headers
+    assert resp_not_modified.status_code == 304
+
+def test_histogram():
+    histogram = Histogram('test_seconds', 'A test histogram.', ('route',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.5, '/a')
+    histogram.observe(5.0, '/a')
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+
 def main():
     test_time_range()
     test_currEpoch()
     test_speed()
     test_avg_speed()
     test_find_location()
+    test_state_vector_store()
+    test_parse_oem_stream()
+    test_epoch_index()
+    test_ground_track()
+    test_hermite_interpolator()
+    test_find_passes()
+    test_illumination()
+    test_gazetteer_geocoder()
+    test_reverse_geocoder_cache()
+    test_feed_cache()
+    test_incremental_refresh()
+    test_refresher()
+    test_snapshot()
+    test_snapshot_refresher()
+    test_concurrent_requests_single_fetch()
     test_epochs_route()
     test_specific_epochs_route()
+    test_specific_epochs_nearest_route()
     test_comment_route()
     test_header_route()
     test_metadata_route()
     test_epoch_query_route()
+    test_epoch_cursor_route()
+    test_epoch_window_route()
+    test_epoch_ndjson_route()
+    test_epoch_bulk_formats()
     test_epoch_speed_route()
     test_epoch_location_route()
     test_now_route()
+    test_at_route()
+    test_groundtrack_route()
+    test_illumination_route()
+    test_eclipses_route()
+    test_passes_route()
+    test_profile_header()
+    test_metrics_route()
+    test_histogram()
+    test_lazy_imports()
+    test_response_cache()
+    test_cached_routes()
+    test_not_modified_route()
 
 if __name__ == '__main__':
     main()